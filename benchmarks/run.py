@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from os.path import abspath, dirname
+
+"""
+Runs the benchmarks in `workloads.py`, reporting the time per operation and
+the peak memory allocated while doing one.
+
+    python benchmarks/run.py                   # the working tree
+    python benchmarks/run.py -k sort -k fib    # only some of the workloads
+    python benchmarks/run.py --compare HEAD~1  # HEAD~1 against working tree
+    python benchmarks/run.py --compare A B     # revision A against B
+
+When comparing, each revision is exported from git to a temporary directory
+and measured in a separate process, using the workloads of the working tree.
+Workloads which got slower by more than the threshold are marked, and make
+the runner exit with status 1.
+
+Each time is the best of a number of rounds, each round running the
+operation enough times to take at least `--min-time` seconds.
+"""
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the DIY Lang parser, evaluator and stdlib.")
+    parser.add_argument("-k", dest="only", action="append", default=[],
+                        help="run only workloads with names containing this "
+                             "(may be repeated)")
+    parser.add_argument("--backend", default="closures",
+                        help="the backend to run the code with "
+                             "(default: closures)")
+    parser.add_argument("--native", action="store_true",
+                        help="use the native versions of the stdlib list "
+                             "functions")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of rounds to take the best of "
+                             "(default: 5)")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimum duration of a round in seconds "
+                             "(default: 0.2)")
+    parser.add_argument("--compare", nargs="+", metavar="REV",
+                        help="compare a git revision to the working tree, "
+                             "or the first of two revisions to the second")
+    parser.add_argument("--threshold", type=float, default=15,
+                        help="slowdown in percent to report as a "
+                             "regression when comparing (default: 15)")
+    parser.add_argument("--source", default=ROOT,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    options = parser.parse_args()
+
+    if options.compare:
+        if len(options.compare) > 2:
+            parser.error("--compare takes one or two revisions")
+        sys.exit(compare(options))
+
+    sys.path.insert(0, options.source)
+    results = measure(options)
+    if options.json:
+        json.dump(results, sys.stdout)
+    else:
+        report(results)
+
+
+def measure(options):
+    """Run the selected workloads, returning a dict from the name of each
+    to its results."""
+
+    from workloads import WORKLOADS
+
+    results = {}
+    for workload in WORKLOADS:
+        name = workload.__name__
+        if options.only and not any(part in name for part in options.only):
+            continue
+        try:
+            operation = workload(options)
+            seconds, number = _time(operation, options.min_time,
+                                    options.repeat)
+            peak = _peak_memory(operation)
+        except Exception as e:
+            results[name] = {"error": "%s: %s" % (type(e).__name__, e)}
+        else:
+            results[name] = {"time": seconds, "number": number,
+                             "peak": peak}
+    return results
+
+
+def _time(operation, min_time, repeat):
+    """Returns the best time per operation of `repeat` rounds, and the number
+    of operations per round."""
+
+    number = 1
+    while True:
+        elapsed = _round(operation, number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, _round(operation, number))
+    return best / number, number
+
+
+def _round(operation, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        operation()
+    return time.perf_counter() - start
+
+
+def _peak_memory(operation):
+    """The peak number of bytes allocated while doing the operation once."""
+
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def compare(options):
+    """Measure two versions of the code and report the differences. Returns
+    the exit status."""
+
+    if len(options.compare) == 1:
+        before, after = options.compare[0], None
+    else:
+        before, after = options.compare
+    results = []
+    for revision in (before, after):
+        if revision is None:
+            results.append(_measure_in_process(options, ROOT))
+            continue
+        directory = tempfile.mkdtemp(prefix="diylang-bench-")
+        try:
+            _export(revision, directory)
+            results.append(_measure_in_process(options, directory))
+        finally:
+            shutil.rmtree(directory)
+
+    regressions = report_comparison(results[0], results[1],
+                                    before, after or "working tree",
+                                    options.threshold)
+    return 1 if regressions else 0
+
+
+def _export(revision, directory):
+    """Write the files of a git revision to a directory."""
+
+    archive = subprocess.run(["git", "archive", revision], cwd=ROOT,
+                             stdout=subprocess.PIPE, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+
+def _measure_in_process(options, source):
+    """Run the workloads on the code in `source`, in a new process."""
+
+    command = [sys.executable, abspath(__file__), "--json",
+               "--source", source, "--backend", options.backend,
+               "--repeat", str(options.repeat),
+               "--min-time", str(options.min_time)]
+    if options.native:
+        command.append("--native")
+    for part in options.only:
+        command.extend(["-k", part])
+    env = dict(os.environ, PYTHONPATH=source)
+    output = subprocess.run(command, env=env, stdout=subprocess.PIPE,
+                            check=True).stdout
+    return json.loads(output.decode("utf-8"))
+
+
+#
+# Reporting
+#
+
+
+def report(results):
+    print("%-22s %12s %8s %12s" % ("workload", "time/op", "ops", "peak mem"))
+    for name, result in results.items():
+        if "error" in result:
+            print("%-22s %s" % (name, result["error"]))
+        else:
+            print("%-22s %12s %8d %12s" % (
+                name, _format_time(result["time"]), result["number"],
+                _format_size(result["peak"])))
+
+
+def report_comparison(before, after, before_name, after_name, threshold):
+    """Print the results of two runs side by side. Returns the names of the
+    workloads that got slower by more than `threshold` percent."""
+
+    print("before: %s" % before_name)
+    print("after:  %s" % after_name)
+    print()
+    print("%-22s %12s %12s %8s %12s %12s" % (
+        "workload", "before", "after", "change", "mem before", "mem after"))
+
+    regressions = []
+    for name in sorted(set(before) | set(after), key=_order(before, after)):
+        old, new = before.get(name, {}), after.get(name, {})
+        if "time" not in old or "time" not in new:
+            print("%-22s %12s %12s" % (name, _summary(old), _summary(new)))
+            continue
+        change = (new["time"] / old["time"] - 1) * 100
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  slower"
+        print("%-22s %12s %12s %+7.1f%% %12s %12s%s" % (
+            name, _format_time(old["time"]), _format_time(new["time"]),
+            change, _format_size(old["peak"]), _format_size(new["peak"]),
+            mark))
+    return regressions
+
+
+def _order(before, after):
+    """Keep the workloads in the order they were run."""
+
+    names = list(after) + [name for name in before if name not in after]
+    return names.index
+
+
+def _summary(result):
+    if "time" in result:
+        return _format_time(result["time"])
+    return "error" if "error" in result else "-"
+
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%.3g %s" % (seconds / scale, unit)
+    return "%.3g ns" % (seconds / 1e-9)
+
+
+def _format_size(size):
+    for unit, scale in (("MiB", 2 ** 20), ("KiB", 2 ** 10)):
+        if size >= scale:
+            return "%.1f %s" % (size / scale, unit)
+    return "%d B" % size
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+from os.path import dirname, join
+
+import diylang
+from diylang.evaluator import evaluate
+from diylang.interpreter import interpret, interpret_file
+from diylang.parser import parse, parse_multiple, unparse
+from diylang.types import Environment, String
+
+"""
+The workloads run by the benchmark runner in `run.py`.
+
+Each workload is a function taking the options of the run, doing any setup
+needed, and returning the operation to be timed: a function of no arguments.
+Only the setup may depend on the options, so the operations are the same on
+every run, and on every revision being compared.
+
+Only the long-standing parts of the API are used, so the workloads can be run
+against older revisions of `diylang` as well. Things which may be missing are
+looked up when needed, and a workload which can't be run is reported as such.
+"""
+
+WORKLOADS = []
+
+
+def workload(fn):
+    WORKLOADS.append(fn)
+    return fn
+
+
+def _evaluator(options):
+    """The `evaluate` function of the backend to benchmark."""
+
+    if options.backend == "closures":
+        return evaluate
+    from diylang.interpreter import BACKENDS
+    return BACKENDS[options.backend]
+
+
+def _stdlib_env(options):
+    """A fresh environment with the stdlib of the `diylang` being measured
+    loaded, natively or not."""
+
+    env = Environment()
+    path = join(dirname(dirname(diylang.__file__)), "stdlib.diy")
+    interpret_file(path, env)
+    if options.native:
+        from diylang import native
+        native.install(env)
+    return env
+
+
+def _program(options, env, expression, definitions=None):
+    """Define the function in `definitions`, if any, and return an operation
+    which evaluates `expression`."""
+
+    if definitions:
+        interpret(definitions, env)
+    evaluate = _evaluator(options)
+    ast = parse(expression)
+    return lambda: evaluate(ast, env)
+
+
+def _generated_source(count):
+    """A large program with `count` varied top-level definitions."""
+
+    lines = []
+    for i in range(count):
+        lines.append(
+            ";; definition number %d\n"
+            "(define fn-%d\n"
+            "    (lambda (x y)\n"
+            "        (if (> x %d)\n"
+            "            (cons 'item-%d\n"
+            "                  (cons \"string %d (with parens)\" '()))\n"
+            "            (let ((z (* x y)))\n"
+            "                (+ z #t)))))\n" % (i, i, i, i, i))
+    return "\n".join(lines)
+
+
+#
+# The parser
+#
+
+
+@workload
+def parse_large_source(options):
+    source = _generated_source(2000)
+    return lambda: parse_multiple(source)
+
+
+@workload
+def unparse_large_source(options):
+    asts = parse_multiple(_generated_source(2000))
+    return lambda: [unparse(ast) for ast in asts]
+
+
+@workload
+def parse_deep_nesting(options):
+    source = "(" * 500 + "x" + ")" * 500
+    return lambda: parse(source)
+
+
+#
+# Function calls and recursion
+#
+
+
+@workload
+def fact(options):
+    return _program(options, Environment(), "(fact 200)", """
+        (define fact
+            (lambda (n)
+                (if (eq n 0)
+                    1
+                    (* n (fact (- n 1))))))
+    """)
+
+
+@workload
+def fib(options):
+    return _program(options, Environment(), "(fib 18)", """
+        (define fib
+            (lambda (n)
+                (if (> 2 n)
+                    n
+                    (+ (fib (- n 1)) (fib (- n 2))))))
+    """)
+
+
+@workload
+def tail_loop(options):
+    return _program(options, Environment(), "(loop 20000 0)", """
+        (define loop
+            (lambda (n acc)
+                (if (eq n 0)
+                    acc
+                    (loop (- n 1) (+ acc n)))))
+    """)
+
+
+@workload
+def constant_folding(options):
+    # Arithmetic and conditionals on literals, as found in generated code,
+    # optimised before running where the optimizer exists.
+    try:
+        from diylang.optimizer import optimize
+    except ImportError:
+        def optimize(ast):
+            return ast
+    env = Environment()
+    evaluate = _evaluator(options)
+    evaluate(optimize(parse("""
+        (define count
+            (lambda (n acc)
+                (if (eq n 0)
+                    acc
+                    (count (- n (- 3 2))
+                           (+ acc (if (> (* 2 10) (+ 5 5))
+                                      (mod (* 7 (+ 1 2)) (- 10 6))
+                                      (undefined)))))))
+    """)), env)
+    ast = optimize(parse("(count 5000 0)"))
+    return lambda: evaluate(ast, env)
+
+
+@workload
+def closures_kept(options):
+    # Mostly of interest for its peak memory: every closure is kept, along
+    # with the frame of the call it was made in.
+    return _program(options, Environment(), "(adders 5000 '())", """
+        (define adders
+            (lambda (n acc)
+                (if (eq n 0)
+                    acc
+                    (adders (- n 1) (cons (lambda (x) (+ x n)) acc)))))
+    """)
+
+
+#
+# The list functions from the stdlib
+#
+
+
+@workload
+def range_length(options):
+    return _program(options, _stdlib_env(options), "(length (range 1 5000))")
+
+
+@workload
+def map_filter(options):
+    return _program(options, _stdlib_env(options), """
+        (filter (lambda (x) (eq (mod x 3) 0))
+                (map (lambda (x) (* x x)) (range 1 2000)))
+    """)
+
+
+@workload
+def sort(options):
+    return _program(options, _stdlib_env(options), """
+        (sort (map (lambda (x) (mod (* x 7919) 1000)) (range 1 1000)))
+    """)
+
+
+@workload
+def pmap_fib(options):
+    env = _stdlib_env(options)
+    from diylang import parallel
+    if hasattr(parallel, "install"):
+        parallel.install(env)
+    return _program(options, env, """
+        (pmap fib (range 10 17))
+    """, """
+        (define fib
+            (lambda (n)
+                (if (> 2 n)
+                    n
+                    (+ (fib (- n 1)) (fib (- n 2))))))
+    """)
+
+
+#
+# Strings
+#
+
+
+@workload
+def string_walk(options):
+    env = Environment({"text": String("abcdefghij" * 5000)})
+    return _program(options, env, "(count text 0)", """
+        (define count
+            (lambda (s n)
+                (if (empty s)
+                    n
+                    (count (tail s) (+ n 1)))))
+    """)
+
+
+@workload
+def string_reverse(options):
+    env = Environment({"text": String("abcdefghij" * 100)})
+    return _program(options, env, '(reverse-onto text "")', """
+        (define reverse-onto
+            (lambda (s acc)
+                (if (empty s)
+                    acc
+                    (reverse-onto (tail s) (cons (head s) acc)))))
+    """)
+
+
+@workload
+def string_tails(options):
+    # Likewise, every tail of the string is kept, each a view of the text.
+    env = Environment({"text": String("abcdefghij" * 500)})
+    return _program(options, env, "(tails text '())", """
+        (define tails
+            (lambda (s acc)
+                (if (empty s)
+                    acc
+                    (tails (tail s) (cons s acc)))))
+    """)
@@ -1,14 +1,66 @@
 # -*- coding: utf-8 -*-
 
-from .types import Closure, String
+from .types import Closure, Builtin, String, Cons, Symbol
 
 """
 This module contains a few simple helper functions for checking the type of
 ASTs.
+
+`kind_of` tells which kind of value something is, with a single lookup of
+its class in a table, for code choosing between several kinds at once. The
+`is_*` functions each check for a single kind.
 """
 
+SYMBOL = "symbol"
+INTEGER = "integer"
+BOOLEAN = "boolean"
+STRING = "string"
+LIST = "list"
+CLOSURE = "closure"
+BUILTIN = "builtin"
+
+ATOM_KINDS = frozenset([SYMBOL, INTEGER, BOOLEAN, STRING, CLOSURE, BUILTIN])
+
+_KINDS = {
+    Symbol: SYMBOL,
+    str: SYMBOL,
+    int: INTEGER,
+    # Booleans are integers in Python, but not in DIY Lang.
+    bool: BOOLEAN,
+    String: STRING,
+    list: LIST,
+    Cons: LIST,
+    Closure: CLOSURE,
+    Builtin: BUILTIN,
+}
+
+# For subclasses of the classes above, in order: bool before int.
+_SUBCLASS_KINDS = [(bool, BOOLEAN), (int, INTEGER), (str, SYMBOL),
+                   (String, STRING), ((list, Cons), LIST),
+                   (Closure, CLOSURE), (Builtin, BUILTIN)]
+
+_MISSING = object()
+
+
+def kind_of(x):
+    """The kind of `x`: one of SYMBOL, INTEGER, BOOLEAN, STRING, LIST,
+    CLOSURE and BUILTIN, or None if it is none of those."""
+
+    kind = _KINDS.get(x.__class__, _MISSING)
+    if kind is _MISSING:
+        # Found the slow way once, then remembered for the class.
+        kind = None
+        for types, subclass_kind in _SUBCLASS_KINDS:
+            if isinstance(x, types):
+                kind = subclass_kind
+                break
+        _KINDS[x.__class__] = kind
+    return kind
+
 
 def is_symbol(x):
+    # Symbols from the parser are interned Symbols, while plain strings are
+    # accepted as symbols in ASTs made by hand.
     return isinstance(x, str)
 
 
@@ -17,7 +69,7 @@ def is_string(x):
 
 
 def is_list(x):
-    return isinstance(x, list)
+    return isinstance(x, (list, Cons))
 
 
 def is_boolean(x):
@@ -32,9 +84,23 @@ def is_closure(x):
     return isinstance(x, Closure)
 
 
+def is_builtin(x):
+    return isinstance(x, Builtin)
+
+
+# Symbols, integers (and booleans, which are integers in Python), strings,
+# closures and builtins, all checked by a single isinstance.
+_ATOMS = (str, int, String, Closure, Builtin)
+
+
 def is_atom(x):
-    return (is_symbol(x) or
-            is_integer(x) or
-            is_string(x) or
-            is_boolean(x) or
-            is_closure(x))
+    return isinstance(x, _ATOMS)
+
+
+def check_length(ast, length):
+    """Returns an error message if the form has the wrong number of
+    arguments, None otherwise."""
+
+    if len(ast) != length:
+        return "Wrong number of arguments for %s, expected %d got %d" % (
+            ast[0], length - 1, len(ast) - 1)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+import marshal
+import os
+import sys
+import zlib
+from os.path import expanduser, join
+
+from . import interpreter
+from .parser import parse_stream
+from .types import Environment, Closure, Cons, String, Symbol, symbol
+
+"""
+Caching of loaded DIY Lang files on disk, for the next process to use.
+
+`parse_file` gives the ASTs of a file, like `parse_stream`. When the file is
+parsed, the ASTs are saved in the cache directory. The next time, if the
+file has the same modification time and size, the ASTs are loaded from the
+cache instead, without reading the file at all -- much like Python does with
+its `.pyc` files. `interpret_file` uses it when given `cache=True`.
+
+`load_environment` gives the global environment resulting from running a
+file of definitions, such as `stdlib.diy`. The first time, the file is run
+as usual, and the environment is saved as an image in the cache directory.
+After that, as long as the file is unchanged, the environment is loaded from
+the image instead. The bodies of the closures in it are compiled when they
+are first called, rather than all at once.
+
+Images are written with `marshal`, which is built into Python and fast to
+load. (Merely importing `pickle` takes longer than running `stdlib.diy`.) The
+values are encoded as the lists, tuples and atoms it supports, with tuples,
+which never occur in ASTs, marking Strings, Cons cells and closures. Symbols
+are saved as plain strings, and interned again when loaded. Only
+environments holding such values, and closures defined in the environment
+itself, can be saved; anything else is simply run every time.
+
+Cache files of ASTs are named after a checksum of the path of the file.
+Images of environments are named after a checksum of the file's contents, and
+hold the contents as well, so a changed file is never confused with an old
+one. The names also depend on `FORMAT` and the Python version, as the cache
+files depend on both. Cache files which can not be read or written are
+ignored.
+
+The cache directory is `$DIYLANG_CACHE` if set, or `~/.cache/diylang`.
+"""
+
+# Change this whenever the encoding of the values changes, so that older
+# cache files are no longer used.
+FORMAT = 2
+
+
+def cache_dir():
+    return os.environ.get("DIYLANG_CACHE",
+                          join(expanduser("~"), ".cache", "diylang"))
+
+
+def load_environment(filename, backend="closures", directory=None,
+                     env=None):
+    """Returns an Environment with the definitions from the file, loaded
+    from the cache if possible. The backend is used to run the file when it
+    is not.
+
+    The definitions are made in `env` if given, which should be empty, or
+    else in a new Environment. If running the file fails, the definitions
+    made before the failure are left in `env`, and nothing is cached."""
+
+    if env is None:
+        env = Environment()
+    with open(filename, "rb") as sourcefile:
+        source = sourcefile.read()
+    path = _cache_path(directory, "env", source)
+
+    image = _read(path, source)
+    if image is not None:
+        return _decode_environment(image, env)
+
+    interpreter.interpret_file(filename, env, backend)
+    try:
+        image = _encode_environment(env)
+    except _Unsupported:
+        return env
+    _write(path, source, image)
+    return env
+
+
+def parse_file(filename, directory=None):
+    """Yields the ASTs of the expressions in a file, like `parse_stream`.
+
+    They are loaded from the cache if it has them for the file as it is now.
+    Otherwise the file is parsed, one expression at a time, and the ASTs are
+    saved once all of them have been read."""
+
+    status = os.stat(filename)
+    stamp = (os.path.abspath(filename), status.st_mtime_ns, status.st_size)
+    path = _cache_path(directory, "ast", stamp[0].encode("utf-8"))
+
+    saved = _read(path, stamp)
+    if saved is not None:
+        for ast in saved:
+            yield _decode_ast(ast)
+        return
+
+    asts = []
+    with open(filename, "r") as sourcefile:
+        for ast in parse_stream(sourcefile):
+            asts.append(_encode(ast))
+            yield ast
+    _write(path, stamp, asts)
+
+
+#
+# Cache files
+#
+
+
+def _cache_path(directory, kind, name):
+    header = ("%s %d %s\n" % (kind, FORMAT, sys.version)).encode("utf-8")
+    checksum = zlib.crc32(name, zlib.crc32(header))
+    return join(directory or cache_dir(),
+                "%s-%08x-%d.marshal" % (kind, checksum, len(name)))
+
+
+def _read(path, key):
+    """The contents saved with `key`, or None if there are none. The key
+    identifies what the contents were made from."""
+
+    try:
+        with open(path, "rb") as cachefile:
+            # Much faster than marshal.load, which reads the file in small
+            # pieces.
+            saved_key, contents = marshal.loads(cachefile.read())
+    except Exception:
+        # Missing, unreadable or from an incompatible version of the code.
+        return None
+    if saved_key != key:
+        return None
+    return contents
+
+
+def _write(path, key, contents):
+    """Save the contents with `key` to the path. The file is written under
+    another name and then moved in place, so a half-written file is never
+    read."""
+
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, "wb") as cachefile:
+            marshal.dump((key, contents), cachefile)
+        os.replace(temporary, path)
+    except (OSError, ValueError):
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+#
+# Encoding of values
+#
+
+
+class _Unsupported(Exception):
+    """Raised for values which can't be saved in the cache."""
+    pass
+
+
+def _encode(value, closure_index=None):
+    """Encode a value, or an AST. Closures can only be encoded when given
+    `closure_index`, a function returning the position of a closure in the
+    table of closures saved along with the value."""
+
+    cls = value.__class__
+    if cls is int or cls is bool or cls is str:
+        return value
+    if cls is Symbol:
+        # marshal only takes plain strings
+        return str(value)
+    if cls is list:
+        return [_encode(x, closure_index) for x in value]
+    if cls is String:
+        return ("string", value.val)
+    if cls is Cons:
+        return ("cons", [_encode(x, closure_index) for x in value])
+    if cls is Closure and closure_index is not None:
+        return ("closure", closure_index(value))
+    raise _Unsupported(value)
+
+
+def _decode(value, closures=None):
+    cls = value.__class__
+    if cls is list:
+        return [_decode(x, closures) for x in value]
+    if cls is str:
+        return symbol(value)
+    if cls is not tuple:
+        return value
+    kind, data = value
+    if kind == "string":
+        return String(data)
+    if kind == "cons":
+        lst = []
+        for item in reversed(data):
+            lst = Cons(_decode(item, closures), lst)
+        return lst
+    return closures[data]
+
+
+def _decode_ast(ast):
+    """Decode an AST, which can only hold Strings and Symbols besides plain
+    values. The lists are decoded in place, rather than copied."""
+
+    cls = ast.__class__
+    if cls is tuple:
+        return String(ast[1])
+    if cls is str:
+        return symbol(ast)
+    if cls is list:
+        _decode_list(ast)
+    return ast
+
+
+def _decode_list(lst):
+    for i, x in enumerate(lst):
+        cls = x.__class__
+        if cls is str:
+            lst[i] = symbol(x)
+        elif cls is list:
+            _decode_list(x)
+        elif cls is tuple:
+            lst[i] = String(x[1])
+
+
+def _encode_environment(env):
+    """The bindings of a global environment, as a tuple of (closures,
+    bindings). Each closure defined in the environment is encoded once, and
+    referred to by its position, so that closures bound to several names are
+    still the same closure when loaded."""
+
+    if env.__class__ is not Environment:
+        raise _Unsupported(env)
+
+    closures = []
+    index = {}
+
+    def closure_index(closure):
+        if closure.env is not env:
+            raise _Unsupported(closure)
+        if id(closure) not in index:
+            index[id(closure)] = len(closures)
+            closures.append(None)
+            closures[index[id(closure)]] = (_encode(closure.params),
+                                            _encode(closure.body),
+                                            _encode_name(closure.name))
+        return index[id(closure)]
+
+    bindings = dict((_encode_name(name), _encode(value, closure_index))
+                    for name, value in env.bindings.items())
+    return closures, bindings
+
+
+def _encode_name(name):
+    return name if name is None else str(name)
+
+
+def _decode_environment(image, env):
+    closures, bindings = image
+
+    decoded = []
+    for params, body, name in closures:
+        closure = Closure(env, _decode(params), _decode(body))
+        closure.name = name if name is None else symbol(name)
+        decoded.append(closure)
+    for name, value in bindings.items():
+        env.bindings[symbol(name)] = _decode(value, decoded)
+    Environment.version += 1
+    return env
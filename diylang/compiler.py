@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+from .ast import is_symbol, is_list, is_integer, check_length, kind_of, \
+    SYMBOL, LIST
+from .parser import unparse
+from .primitives import PRIMITIVES
+from .types import from_list
+from . import memo
+
+"""
+The bytecode compiler, translating ASTs into code for the virtual machine
+in `vm.py`.
+
+Compiled code is a flat array of instructions. Each instruction is two
+integers: an opcode, and a single argument whose meaning depends on the
+opcode. Values used by the code are kept in a constant pool, and symbols in
+a symbol table, with the instructions referring to them by index.
+
+Calls in tail position are compiled to TAIL_CALL, which lets the VM reuse the
+frame of the calling function rather than pushing a new one.
+"""
+
+# Opcode            Argument
+CONST = 0          # index of constant to push
+LOOKUP = 1         # index of symbol to look up and push
+PRIMITIVE = 2      # index into PRIMITIVE_TABLE; operands are on the stack
+JUMP = 3           # index of instruction to jump to
+JUMP_IF_FALSE = 4  # index of instruction to jump to if popped value is false
+CALL = 5           # number of arguments above the function on the stack
+TAIL_CALL = 6      # number of arguments, as for CALL
+RETURN = 7         # -
+CLOSURE = 8        # index of constant holding the Code of the function
+DEFINE = 9         # index of symbol to bind to the popped value
+ENTER = 10         # - (starts a new, empty environment for let)
+BIND = 11          # index of symbol to bind to the popped value, in place
+LEAVE = 12         # - (returns to the environment enclosing the let)
+FAIL = 13          # index of constant holding an error message
+
+OPCODE_NAMES = [
+    "CONST", "LOOKUP", "PRIMITIVE", "JUMP", "JUMP_IF_FALSE", "CALL",
+    "TAIL_CALL", "RETURN", "CLOSURE", "DEFINE", "ENTER", "BIND", "LEAVE",
+    "FAIL"]
+
+PRIMITIVE_NAMES = sorted(PRIMITIVES)
+PRIMITIVE_TABLE = [PRIMITIVES[name] for name in PRIMITIVE_NAMES]
+_PRIMITIVE_INDEX = dict((name, i) for i, name in enumerate(PRIMITIVE_NAMES))
+
+
+class Code(object):
+
+    """
+    A piece of compiled code, either a top-level expression or the body of a
+    function. For functions, `params` and `body` are those of the lambda.
+    """
+
+    def __init__(self, instructions, constants, names, params=None,
+                 body=None):
+        self.instructions = instructions
+        self.constants = constants
+        self.names = names
+        self.params = params
+        self.body = body
+
+    def __repr__(self):
+        return "<code/%d instructions>" % (len(self.instructions) // 2)
+
+
+def compile_program(ast):
+    """Compile a top-level expression."""
+
+    compiler = _Compiler()
+    compiler.compile(ast, False)
+    compiler.emit(RETURN)
+    return compiler.code()
+
+
+def compile_function(params, body):
+    """Compile the body of a function with the given parameters."""
+
+    compiler = _Compiler()
+    compiler.compile(body, True)
+    compiler.emit(RETURN)
+    return compiler.code(params, body)
+
+
+def disassemble(code):
+    """Returns a readable listing of the instructions in `code`."""
+
+    lines = []
+    instructions = code.instructions
+    for pc in range(0, len(instructions), 2):
+        op, arg = instructions[pc], instructions[pc + 1]
+        if op in (CONST, CLOSURE, FAIL):
+            detail = repr(code.constants[arg])
+        elif op in (LOOKUP, DEFINE, BIND):
+            detail = code.names[arg]
+        elif op == PRIMITIVE:
+            detail = PRIMITIVE_NAMES[arg]
+        elif op in (JUMP, JUMP_IF_FALSE, CALL, TAIL_CALL):
+            detail = str(arg)
+        else:
+            detail = ""
+        lines.append(("%4d %-14s %s" % (pc, OPCODE_NAMES[op], detail))
+                     .rstrip())
+    return "\n".join(lines)
+
+
+class _Compiler(object):
+
+    def __init__(self):
+        self.instructions = []
+        self.constants = []
+        self.names = []
+        self.constant_index = {}
+        self.name_index = {}
+
+    def code(self, params=None, body=None):
+        return Code(array("l", self.instructions), self.constants,
+                    self.names, params, body)
+
+    def emit(self, op, arg=0):
+        """Add an instruction, returning its position."""
+        self.instructions.append(op)
+        self.instructions.append(arg)
+        return len(self.instructions) - 2
+
+    def patch(self, position, target):
+        """Set the target of the jump at `position`."""
+        self.instructions[position + 1] = target
+
+    def here(self):
+        return len(self.instructions)
+
+    def constant(self, value):
+        # Only plain atoms are shared; the type is part of the key since
+        # True == 1 in Python.
+        if is_symbol(value) or is_integer(value):
+            key = (type(value), value)
+            if key not in self.constant_index:
+                self.constant_index[key] = len(self.constants)
+                self.constants.append(value)
+            return self.constant_index[key]
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def name(self, symbol):
+        if symbol not in self.name_index:
+            self.name_index[symbol] = len(self.names)
+            self.names.append(symbol)
+        return self.name_index[symbol]
+
+    def fail(self, message):
+        self.emit(FAIL, self.constant(message))
+
+    def compile(self, ast, tail):
+        """Emit code leaving the value of `ast` on the stack. If `tail` is
+        true, the expression is in tail position of a function body."""
+
+        kind = kind_of(ast)
+        if kind is SYMBOL:
+            self.emit(LOOKUP, self.name(ast))
+        elif kind is LIST:
+            if not ast:
+                self.fail("Cannot call an empty list. Did you mean '()?")
+                return
+            head = ast[0]
+            if is_symbol(head) and head in _SPECIAL_FORMS:
+                _SPECIAL_FORMS[head](self, ast, tail)
+            elif is_symbol(head) and head in PRIMITIVES:
+                self.compile_primitive(ast)
+            else:
+                self.compile_call(ast, tail)
+        else:
+            # integers, booleans, strings and closures evaluate to themselves
+            self.emit(CONST, self.constant(ast))
+
+    def compile_call(self, ast, tail):
+        for exp in ast:
+            self.compile(exp, False)
+        self.emit(TAIL_CALL if tail else CALL, len(ast) - 1)
+
+    def compile_primitive(self, ast):
+        arity, _ = PRIMITIVES[ast[0]]
+        error = check_length(ast, arity + 1)
+        if error:
+            return self.fail(error)
+        for exp in ast[1:]:
+            self.compile(exp, False)
+        self.emit(PRIMITIVE, _PRIMITIVE_INDEX[ast[0]])
+
+    def compile_quote(self, ast, tail):
+        error = check_length(ast, 2)
+        if error:
+            return self.fail(error)
+        value = ast[1]
+        if is_list(value):
+            value = from_list(value)
+        self.emit(CONST, self.constant(value))
+
+    def compile_if(self, ast, tail):
+        error = check_length(ast, 4)
+        if error:
+            return self.fail(error)
+        self.compile(ast[1], False)
+        to_alternative = self.emit(JUMP_IF_FALSE)
+        self.compile(ast[2], tail)
+        to_end = self.emit(JUMP)
+        self.patch(to_alternative, self.here())
+        self.compile(ast[3], tail)
+        self.patch(to_end, self.here())
+
+    def compile_cond(self, ast, tail):
+        error = check_length(ast, 2)
+        if error:
+            return self.fail(error)
+        if not is_list(ast[1]) or not all(is_list(c) and len(c) == 2
+                                          for c in ast[1]):
+            return self.fail("The argument of cond must be a list of "
+                             "(predicate expression) pairs")
+        to_end = []
+        for predicate, consequent in ast[1]:
+            self.compile(predicate, False)
+            to_next = self.emit(JUMP_IF_FALSE)
+            self.compile(consequent, tail)
+            to_end.append(self.emit(JUMP))
+            self.patch(to_next, self.here())
+        self.emit(CONST, self.constant(False))
+        for position in to_end:
+            self.patch(position, self.here())
+
+    def compile_define(self, ast, tail):
+        error = check_length(ast, 3)
+        if error:
+            return self.fail(error)
+        if not is_symbol(ast[1]):
+            return self.fail("%s is not a symbol" % unparse(ast[1]))
+        self.compile(ast[2], False)
+        self.emit(DEFINE, self.name(ast[1]))
+
+    def compile_lambda(self, ast, tail):
+        error = check_length(ast, 3)
+        if error:
+            return self.fail(error)
+        self.compile_function(ast[1], ast[2])
+
+    def compile_defn(self, ast, tail):
+        error = check_length(ast, 4)
+        if error:
+            return self.fail(error)
+        if not is_symbol(ast[1]):
+            return self.fail("%s is not a symbol" % unparse(ast[1]))
+        self.compile_function(ast[2], ast[3])
+        self.emit(DEFINE, self.name(ast[1]))
+
+    def compile_defn_memo(self, ast, tail):
+        error = check_length(ast, 4)
+        if error:
+            return self.fail(error)
+        if not is_symbol(ast[1]):
+            return self.fail("%s is not a symbol" % unparse(ast[1]))
+        self.compile([memo.memoize_named(ast[1]),
+                      ["lambda", ast[2], ast[3]]], False)
+        self.emit(DEFINE, self.name(ast[1]))
+
+    def compile_function(self, params, body):
+        if not is_list(params):
+            return self.fail("The parameters of a function must be a list, "
+                             "got %s" % unparse(params))
+        for param in params:
+            if not is_symbol(param):
+                return self.fail("%s is not a symbol" % unparse(param))
+        self.emit(CLOSURE, self.constant(compile_function(params, body)))
+
+    def compile_let(self, ast, tail):
+        error = check_length(ast, 3)
+        if error:
+            return self.fail(error)
+        if not is_list(ast[1]) or not all(
+                is_list(b) and len(b) == 2 and is_symbol(b[0])
+                for b in ast[1]):
+            return self.fail("The bindings of let must be a list of "
+                             "(symbol expression) pairs")
+        self.emit(ENTER)
+        for name, value in ast[1]:
+            self.compile(value, False)
+            self.emit(BIND, self.name(name))
+        self.compile(ast[2], tail)
+        self.emit(LEAVE)
+
+
+_SPECIAL_FORMS = {
+    "quote": _Compiler.compile_quote,
+    "if": _Compiler.compile_if,
+    "cond": _Compiler.compile_cond,
+    "define": _Compiler.compile_define,
+    "lambda": _Compiler.compile_lambda,
+    "defn": _Compiler.compile_defn,
+    "let": _Compiler.compile_let,
+    "defn-memo": _Compiler.compile_defn_memo,
+}
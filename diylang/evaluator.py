@@ -1,20 +1,724 @@
 # -*- coding: utf-8 -*-
 
-from .types import Environment, DiyLangError, Closure, String
-from .ast import is_boolean, is_atom, is_symbol, is_list, is_closure, \
-    is_integer, is_string
+import threading
+
+from .types import Environment, Frame, DiyLangError, Closure, UNBOUND, \
+    from_list
+from .ast import is_symbol, is_list, is_closure, is_builtin, check_length, \
+    kind_of, SYMBOL, LIST
 from .parser import unparse
+from .primitives import PRIMITIVES
+from . import memo
 
 """
 This is the Evaluator module. The `evaluate` function below is the heart
-of your language, and the focus for most of parts 2 through 6.
+of the language.
+
+Rather than walking the AST every time a piece of code is run, each AST is
+first compiled into a tree of Python functions, one for each node. Each of
+these takes an environment and returns the value of the node. All decisions
+that depend only on the shape of the AST -- whether it is a symbol or a list,
+which special form is used, how many arguments there are -- are made once, at
+compile time, leaving only the actual work to be done at run time.
+
+The body of a `lambda` is compiled along with the rest of the AST, and the
+resulting code is kept in the closures created from it. A function body is
+thus compiled once, no matter how many times it is called.
+
+Function calls and `let` forms bind their variables in a `Frame`, holding the
+values in a list. The compiler keeps track of which names are bound in which
+frames (the scope), so each reference to a variable bound by an enclosing
+`lambda` or `let` is resolved at compile time to a position: how many frames
+up, and which slot in that frame. Only variables defined elsewhere, such as
+at the top level, are looked up by name, starting above the known frames.
+
+The function called by a call site is usually such a global variable, and
+is the same one every time. Each of these call sites keeps what it found
+the last time, along with where it started looking and the version of the
+environments: a counter bumped whenever a variable is defined in any
+environment (see `Environment.version`). As long as neither has changed,
+the function is taken from the cache, without looking it up again. A new
+definition, in the REPL say, is seen by the very next call.
 
-A score of useful functions is provided for you, as per the above imports,
-making your work a bit easier. (We're supposed to get through this thing
-in a day, after all.)
+Calls in tail position -- the last thing done by a function body, through
+any number of `if`, `cond` and `let` forms -- are not made by the function
+itself, but handed back to its caller. The caller then runs the called
+function in a loop, so tail recursion runs in constant Python stack depth.
+
+Code compiled by `compile_monitored` reports to a monitor as it runs, such
+as the profiler in `profiler.py` or the limits in `limits.py`. Other code is
+compiled without any trace of monitoring, and costs nothing extra.
 """
 
 
+class _Monitors(threading.local):
+
+    # The monitor to report to from the code being compiled, if any. Only set
+    # while `compile_monitored` is compiling.
+    compiling = None
+
+    # The monitor of the code being run, if any. Set by `run_monitored`, so
+    # that functions called through `apply`, by builtins, are monitored too.
+    running = None
+
+
+# Kept for each thread, so that code compiled or run in one thread is not
+# monitored by another thread's monitor.
+_monitors = _Monitors()
+
+
 def evaluate(ast, env):
     """Evaluate an Abstract Syntax Tree in the specified environment."""
-    raise NotImplementedError("DIY")
+    return compile_ast(ast)(env)
+
+
+def compile_monitored(ast, monitor, params=None):
+    """Compile an AST like `compile_ast`, into code reporting to the
+    monitor: each special form and primitive is wrapped by `monitor.form`,
+    each function called runs the body given by `monitor.body`, and each
+    builtin is called by `monitor.call_builtin`. The code should be run with
+    `run_monitored`. Builtins building lists may tell the monitor of them by
+    `monitor.allocate`, see `native.py`.
+
+    With `params`, the AST is compiled as the body of a function with those
+    parameters instead."""
+
+    monitors = _monitors
+    previous, monitors.compiling = monitors.compiling, monitor
+    try:
+        if params is None:
+            return compile_ast(ast)
+        return _compile_body(params, ast, None)
+    finally:
+        monitors.compiling = previous
+
+
+def running_monitor():
+    """The monitor of the code being run, if any."""
+    return _monitors.running
+
+
+def run_monitored(code, env, monitor):
+    """Run code compiled by `compile_monitored` in the environment."""
+
+    monitors = _monitors
+    previous, monitors.running = monitors.running, monitor
+    try:
+        return code(env)
+    finally:
+        monitors.running = previous
+
+
+class Monitor(object):
+
+    """
+    Base class of the monitors given to `compile_monitored`, such as the
+    profiler and the limits. The code of each closure body is compiled for
+    the monitor the first time the closure is called, and wrapped by
+    `monitor_body`, then kept for the next calls.
+    """
+
+    def __init__(self):
+        # The monitored code of the closure bodies run so far, by body,
+        # parameters and name (which the profiler reports), along with the
+        # body and parameters, kept so that their ids are not reused.
+        self._bodies = {}
+
+    def form(self, name, code):
+        """Wrap the compiled code of a special form or primitive."""
+        return code
+
+    def body(self, closure):
+        """The monitored code of the body of a closure."""
+
+        key = (id(closure.body), id(closure.params), closure.name)
+        try:
+            return self._bodies[key][0]
+        except KeyError:
+            pass
+
+        code = self.monitor_body(
+            closure, compile_monitored(closure.body, self, closure.params))
+        self._bodies[key] = (code, closure.body, closure.params)
+        return code
+
+    def monitor_body(self, closure, code):
+        """Wrap the compiled code of the body of a closure."""
+        return code
+
+    def call_builtin(self, builtin, args):
+        return builtin.call(args)
+
+    def allocate(self, size):
+        """Called by builtins before building a list of `size` elements, and
+        with 0 while they work through long lists."""
+        pass
+
+
+def compile_ast(ast, tail=False, scope=None):
+    """Compile an AST into a function taking an environment, which evaluates
+    the AST in that environment when called.
+
+    If `tail` is true, the AST is in tail position of a function body, and a
+    function call as the last thing it does is not made. Instead the code
+    returns a tuple of the function's compiled body and the environment it
+    should run in, leaving it to the caller to run it.
+
+    The `scope` holds the names bound by the frames the code will run in, if
+    it is inside a function body or `let`.
+    """
+
+    kind = kind_of(ast)
+    if kind is SYMBOL:
+        return _compile_symbol(ast, scope)
+    elif kind is LIST:
+        if not ast:
+            return _fail("Cannot call an empty list. Did you mean '()?")
+        head = ast[0]
+        if is_symbol(head) and (head in _SPECIAL_FORMS or head in PRIMITIVES):
+            if head in _SPECIAL_FORMS:
+                code = _SPECIAL_FORMS[head](ast, tail, scope)
+            else:
+                code = _compile_primitive(ast, scope)
+            monitor = _monitors.compiling
+            if monitor is not None:
+                code = monitor.form(head, code)
+            return code
+        return _compile_call(ast, tail, scope)
+    else:
+        # integers, booleans, strings and closures evaluate to themselves
+        return _compile_constant(ast)
+
+
+def apply(closure, args):
+    """Call a closure with a list of already evaluated arguments."""
+
+    monitor = _monitors.running
+    if monitor is not None:
+        code, env = _prepare_monitored(closure, list(args), monitor)
+    else:
+        code, env = _prepare(closure, args)
+    return _run(code, env)
+
+
+def _prepare(closure, args):
+    """Returns the compiled body of a closure, and the environment to run it
+    in with the given arguments."""
+
+    if not is_closure(closure):
+        if is_builtin(closure):
+            # There is no body to run; the result is passed on in place of
+            # the environment, to code which just returns it.
+            return _result, closure.call(args)
+        raise DiyLangError("%s is not a function" % unparse(closure))
+    params = closure.params
+    if len(args) != len(params):
+        raise DiyLangError("wrong number of arguments, expected %d got %d"
+                           % (len(params), len(args)))
+    code = closure.code
+    if code is None:
+        code = closure.code = _compile_body(params, closure.body, None)
+    return code, Frame(params, list(args), closure.env)
+
+
+def _result(value):
+    return value
+
+
+def _run(code, env):
+    """Run the compiled body of a function, along with any function bodies
+    it hands back to be run in its place through tail calls. This way, a
+    chain of tail calls runs in a loop here, rather than each call adding to
+    the Python stack."""
+
+    result = code(env)
+    while result.__class__ is tuple:
+        code, env = result
+        result = code(env)
+    return result
+
+
+#
+# Scopes, keeping track of the variables bound in frames at compile time
+#
+
+
+class _Scope(object):
+
+    def __init__(self, names, parent, visible=None, defined=frozenset()):
+        self.names = names
+        self.parent = parent
+        # The names from position `visible` onwards are not bound yet when
+        # the code runs, as for the later bindings of a `let` while the
+        # earlier ones are evaluated.
+        self.visible = len(names) if visible is None else visible
+        # Positions of the names bound by `define` somewhere in the code,
+        # which may or may not have happened yet when the code runs.
+        self.defined = defined
+
+    def view(self, visible):
+        """The same scope, with only the first `visible` names bound."""
+        return _Scope(self.names, self.parent, visible, self.defined)
+
+    def before(self, slot):
+        """The same scope, with only the names before position `slot`."""
+        return _Scope(self.names[:slot], self.parent,
+                      min(self.visible, slot), self.defined)
+
+
+def _resolve(symbol, scope):
+    """Find the frame and slot for a variable. Returns the tuple (depth, slot,
+    scope), where scope is the one of the frame. If the variable is not bound
+    in any of the frames in the scope, slot is None and depth is the number
+    of frames."""
+
+    depth = 0
+    while scope is not None:
+        names = scope.names
+        for slot in range(len(names) - 1, -1, -1):
+            if names[slot] == symbol:
+                return depth, slot, scope
+        scope = scope.parent
+        depth += 1
+    return depth, None, None
+
+
+def _local_definitions(asts):
+    """The names bound with `define` or `defn` by the ASTs directly in the
+    frame they run in, i.e. not within a nested `lambda` or `let`."""
+
+    names = []
+    pending = list(reversed(asts))
+    while pending:
+        node = pending.pop()
+        if not is_list(node) or not node:
+            continue
+        head = node[0]
+        if head in ("quote", "lambda", "let"):
+            continue
+        if head in ("define", "defn", "defn-memo") and len(node) > 1 and \
+                is_symbol(node[1]):
+            if node[1] not in names:
+                names.append(node[1])
+            if head != "define":
+                continue
+        pending.extend(reversed(node))
+    return names
+
+
+def _frame_scope(names, asts, parent):
+    """Scope of a frame binding the given names, as well as any defined by
+    the ASTs to be run in it. Returns the scope and the defined names."""
+
+    definitions = [name for name in _local_definitions(asts)
+                   if name not in names]
+    all_names = list(names) + definitions
+    defined = frozenset(range(len(names), len(all_names)))
+    return _Scope(all_names, parent, defined=defined), definitions
+
+#
+# Compilation of atoms and function calls
+#
+
+
+def _compile_constant(value):
+    return lambda env: value
+
+
+def _compile_symbol(symbol, scope):
+    depth, slot, frame_scope = _resolve(symbol, scope)
+
+    if slot is None:
+        # Not bound in any frame we know of. Skip past those, and look the
+        # name up in whatever environment lies beyond.
+        if depth == 0:
+            return lambda env: env.lookup(symbol)
+        elif depth == 1:
+            return lambda env: env.parent.lookup(symbol)
+
+        def lookup(env):
+            for _ in range(depth):
+                env = env.parent
+            return env.lookup(symbol)
+        return lookup
+
+    if slot >= frame_scope.visible or slot in frame_scope.defined:
+        # The slot might not be bound yet, in which case the name refers to
+        # whatever it would if the slot wasn't there.
+        fallback = _compile_symbol(symbol, frame_scope.before(slot))
+
+        def lookup_unbound(env):
+            for _ in range(depth):
+                env = env.parent
+            value = env.values[slot]
+            if value is UNBOUND:
+                return fallback(env)
+            return value
+        return lookup_unbound
+
+    if depth == 0:
+        return lambda env: env.values[slot]
+    elif depth == 1:
+        return lambda env: env.parent.values[slot]
+    elif depth == 2:
+        return lambda env: env.parent.parent.values[slot]
+
+    def lookup_slot(env):
+        for _ in range(depth):
+            env = env.parent
+        return env.values[slot]
+    return lookup_slot
+
+
+def _compile_call(ast, tail, scope):
+    if kind_of(ast[0]) is SYMBOL:
+        fn = _compile_function_lookup(ast[0], scope)
+    else:
+        fn = compile_ast(ast[0], False, scope)
+    args = [compile_ast(arg, False, scope) for arg in ast[1:]]
+
+    # Calls with few arguments are by far the most common, and are given
+    # their own versions which avoid building the argument list.
+    monitor = _monitors.compiling
+    if monitor is not None:
+        prepare = _monitored_prepare(fn, args, monitor)
+    elif len(args) == 1:
+        arg, = args
+
+        def prepare(env):
+            closure = fn(env)
+            if closure.__class__ is not Closure or len(closure.params) != 1:
+                return _prepare(closure, [arg(env)])
+            code = closure.code
+            if code is None:
+                code = closure.code = _compile_body(
+                    closure.params, closure.body, None)
+            return code, Frame(closure.params, [arg(env)], closure.env)
+    elif len(args) == 2:
+        first, second = args
+
+        def prepare(env):
+            closure = fn(env)
+            if closure.__class__ is not Closure or len(closure.params) != 2:
+                return _prepare(closure, [first(env), second(env)])
+            code = closure.code
+            if code is None:
+                code = closure.code = _compile_body(
+                    closure.params, closure.body, None)
+            return code, Frame(closure.params, [first(env), second(env)],
+                               closure.env)
+    else:
+        def prepare(env):
+            return _prepare(fn(env), [arg(env) for arg in args])
+
+    if tail:
+        return prepare
+
+    def call(env):
+        code, env = prepare(env)
+        result = code(env)
+        while result.__class__ is tuple:
+            code, env = result
+            result = code(env)
+        return result
+    return call
+
+
+def _compile_function_lookup(symbol, scope):
+    """Like `_compile_symbol`, but keeping the value of a variable looked up
+    by name in an inline cache, for the function of a call site."""
+
+    depth, slot, _ = _resolve(symbol, scope)
+    if slot is not None:
+        return _compile_symbol(symbol, scope)
+
+    # The environment started from, the version and the value, replaced all
+    # at once so that threads sharing the code see them together.
+    cache = (None, -1, None)
+
+    def look_up(env):
+        nonlocal cache
+        version = Environment.version
+        value = env.lookup(symbol)
+        if _cacheable(env):
+            cache = (env, version, value)
+        return value
+
+    # Calls at the top level, and in function bodies, are by far the most
+    # common, and are given their own versions.
+    if depth == 0:
+        def lookup(env):
+            c = cache
+            if c[0] is env and c[1] == Environment.version:
+                return c[2]
+            return look_up(env)
+    elif depth == 1:
+        def lookup(env):
+            env = env.parent
+            c = cache
+            if c[0] is env and c[1] == Environment.version:
+                return c[2]
+            return look_up(env)
+    else:
+        def lookup(env):
+            for _ in range(depth):
+                env = env.parent
+            c = cache
+            if c[0] is env and c[1] == Environment.version:
+                return c[2]
+            return look_up(env)
+    return lookup
+
+
+def _cacheable(env):
+    """Whether what is found looking up a name from `env` can be cached.
+    Frames are left out, as their variables are defined without bumping the
+    version, to keep function bodies fast."""
+
+    while env is not None:
+        if env.__class__ is Frame:
+            return False
+        env = env.parent
+    return True
+
+
+def _monitored_prepare(fn, args, monitor):
+    def prepare(env):
+        return _prepare_monitored(fn(env), [arg(env) for arg in args],
+                                  monitor)
+    return prepare
+
+
+def _prepare_monitored(closure, args, monitor):
+    """Like `_prepare`, but giving the body to run by the monitor."""
+
+    if closure.__class__ is Closure and len(closure.params) == len(args):
+        return monitor.body(closure), Frame(closure.params, args,
+                                            closure.env)
+    if is_builtin(closure):
+        return _result, monitor.call_builtin(closure, args)
+    return _prepare(closure, args)
+
+
+def _fail(message):
+    """Code raising an error when (and only if) it is run."""
+
+    def fail(env):
+        raise DiyLangError(message)
+    return fail
+
+
+#
+# Special forms
+#
+
+
+def _compile_quote(ast, tail, scope):
+    error = check_length(ast, 2)
+    if error:
+        return _fail(error)
+    value = ast[1]
+    if is_list(value):
+        # Quoted lists are data from here on, built once as Cons cells.
+        value = from_list(value)
+    return _compile_constant(value)
+
+
+def _compile_if(ast, tail, scope):
+    error = check_length(ast, 4)
+    if error:
+        return _fail(error)
+    predicate = compile_ast(ast[1], False, scope)
+    consequent = compile_ast(ast[2], tail, scope)
+    alternative = compile_ast(ast[3], tail, scope)
+
+    def if_(env):
+        if predicate(env):
+            return consequent(env)
+        return alternative(env)
+    return if_
+
+
+def _compile_cond(ast, tail, scope):
+    error = check_length(ast, 2)
+    if error:
+        return _fail(error)
+    if not is_list(ast[1]) or not all(is_list(c) and len(c) == 2
+                                      for c in ast[1]):
+        return _fail("The argument of cond must be a list of "
+                     "(predicate expression) pairs")
+    clauses = [(compile_ast(p, False, scope), compile_ast(e, tail, scope))
+               for p, e in ast[1]]
+
+    def cond(env):
+        for predicate, consequent in clauses:
+            if predicate(env):
+                return consequent(env)
+        return False
+    return cond
+
+
+def _compile_define(ast, tail, scope):
+    error = check_length(ast, 3)
+    if error:
+        return _fail(error)
+    name = ast[1]
+    if not is_symbol(name):
+        return _fail("%s is not a symbol" % unparse(name))
+    return _compile_definition(name, compile_ast(ast[2], False, scope), scope)
+
+
+def _compile_lambda(ast, tail, scope):
+    error = check_length(ast, 3)
+    if error:
+        return _fail(error)
+    return _compile_function(ast[1], ast[2], scope)
+
+
+def _compile_defn(ast, tail, scope):
+    error = check_length(ast, 4)
+    if error:
+        return _fail(error)
+    name = ast[1]
+    if not is_symbol(name):
+        return _fail("%s is not a symbol" % unparse(name))
+    function = _compile_function(ast[2], ast[3], scope)
+    return _compile_definition(name, function, scope)
+
+
+def _compile_defn_memo(ast, tail, scope):
+    error = check_length(ast, 4)
+    if error:
+        return _fail(error)
+    name = ast[1]
+    if not is_symbol(name):
+        return _fail("%s is not a symbol" % unparse(name))
+    function = ["lambda", ast[2], ast[3]]
+    return _compile_define(
+        ["define", name, [memo.memoize_named(name), function]], tail, scope)
+
+
+def _compile_definition(name, value, scope):
+    """Code binding name to the result of the compiled value: in its slot in
+    the current frame, or in the environment when outside of any frame."""
+
+    if scope is None:
+        def define(env):
+            env.set(name, _named(value(env), name))
+            return name
+        return define
+
+    _, slot, _ = _resolve(name, _Scope(scope.names, None))
+    if slot is None:
+        return _compile_definition(name, value, None)
+
+    def define_slot(env):
+        values = env.values
+        if values[slot] is not UNBOUND:
+            raise DiyLangError("Variable '%s' is already defined" % name)
+        values[slot] = _named(value(env), name)
+        return name
+    return define_slot
+
+
+def _named(value, name):
+    """Give a closure the name it is defined with, unless it has one."""
+    if value.__class__ is Closure and value.name is None:
+        value.name = name
+    return value
+
+
+def _compile_function(params, body, scope):
+    if not is_list(params):
+        return _fail("The parameters of a function must be a list, got %s"
+                     % unparse(params))
+    for param in params:
+        if not is_symbol(param):
+            return _fail("%s is not a symbol" % unparse(param))
+    if _monitors.compiling is not None:
+        # The monitor compiles bodies of its own. The closure's code is left
+        # to be compiled as usual, should it be called unmonitored.
+        return lambda env: Closure(env, params, body)
+    code = _compile_body(params, body, scope)
+
+    return lambda env: Closure(env, params, body, code)
+
+
+def _compile_body(params, body, scope):
+    """Compile a function body, to be run in a frame holding the values of
+    the parameters. The scope is that where the function is defined, or None
+    if not known."""
+
+    inner, definitions = _frame_scope(params, [body], scope)
+    code = compile_ast(body, True, inner)
+    if not definitions:
+        return code
+
+    # Make room in the frame for the variables defined in the body.
+    names = inner.names
+    unbound = [UNBOUND] * len(definitions)
+
+    def body_with_definitions(env):
+        env.names = names
+        env.values.extend(unbound)
+        return code(env)
+    return body_with_definitions
+
+
+def _compile_let(ast, tail, scope):
+    error = check_length(ast, 3)
+    if error:
+        return _fail(error)
+    if not is_list(ast[1]) or not all(
+            is_list(b) and len(b) == 2 and is_symbol(b[0]) for b in ast[1]):
+        return _fail("The bindings of let must be a list of "
+                     "(symbol expression) pairs")
+
+    names = [name for name, _ in ast[1]]
+    inner, _ = _frame_scope(names, [value for _, value in ast[1]] + [ast[2]],
+                            scope)
+    # Each binding is evaluated with only those before it bound.
+    values = [compile_ast(value, False, inner.view(i))
+              for i, (_, value) in enumerate(ast[1])]
+    body = compile_ast(ast[2], tail, inner)
+    frame_names = inner.names
+    size = len(frame_names)
+
+    def let(env):
+        frame = Frame(frame_names, [UNBOUND] * size, env)
+        slots = frame.values
+        for i, value in enumerate(values):
+            slots[i] = value(frame)
+        return body(frame)
+    return let
+
+
+_SPECIAL_FORMS = {
+    "quote": _compile_quote,
+    "if": _compile_if,
+    "cond": _compile_cond,
+    "define": _compile_define,
+    "lambda": _compile_lambda,
+    "defn": _compile_defn,
+    "let": _compile_let,
+    "defn-memo": _compile_defn_memo,
+}
+
+#
+# Primitive operations, see `primitives.py`
+#
+
+
+def _compile_primitive(ast, scope):
+    arity, operation = PRIMITIVES[ast[0]]
+    error = check_length(ast, arity + 1)
+    if error:
+        return _fail(error)
+
+    if arity == 1:
+        arg = compile_ast(ast[1], False, scope)
+        return lambda env: operation(arg(env))
+    else:
+        first = compile_ast(ast[1], False, scope)
+        second = compile_ast(ast[2], False, scope)
+        return lambda env: operation(first(env), second(env))
@@ -1,36 +1,78 @@
 # -*- coding: utf-8 -*-
 
-from .evaluator import evaluate
-from .parser import parse, unparse, parse_multiple
-from .types import Environment
+from . import evaluator, vm, optimizer, cache as ast_cache
+from .parser import parse, unparse, parse_stream
+from .types import Environment, DiyLangError
 
+# The ways of running DIY Lang code: compiled to Python closures by the
+# evaluator, or compiled to bytecode for the virtual machine.
+BACKENDS = {
+    "closures": evaluator.evaluate,
+    "vm": vm.evaluate,
+}
 
-def interpret(source, env=None):
+
+def interpret(source, env=None, backend="closures", optimize=False):
     """
     Interpret a DIY Lang program statement
 
     Accepts a program statement as a string, interprets it, and then
     returns the resulting DIY Lang expression as string.
+
+    With `optimize`, the statement is optimised before it is run, see
+    `optimizer.py`.
     """
     if env is None:
         env = Environment()
 
-    return unparse(evaluate(parse(source), env))
+    evaluate = _backend(backend)
+    ast = parse(source)
+    if optimize:
+        ast = optimizer.optimize(ast)
+    return unparse(evaluate(ast, env))
 
 
-def interpret_file(filename, env=None):
+def interpret_file(filename, env=None, backend="closures", cache=False,
+                   optimize=False):
     """
     Interpret a DIY Lang file
 
     Accepts the name of a DIY Lang file containing a series of statements.
     Returns the value of the last expression of the file.
+
+    With `cache`, the parsed file is kept in the cache directory, and only
+    parsed again once it has changed. With `optimize`, each statement is
+    optimised before it is run.
     """
     if env is None:
         env = Environment()
 
-    with open(filename, 'r') as sourcefile:
-        source = "".join(sourcefile.readlines())
+    evaluate = _backend(backend)
+    if optimize:
+        run = evaluate
+
+        def evaluate(ast, env):
+            return run(optimizer.optimize(ast), env)
+
+    result = None
+    if cache:
+        for ast in ast_cache.parse_file(filename):
+            result = evaluate(ast, env)
+    else:
+        with open(filename, 'r') as sourcefile:
+            for ast in parse_stream(sourcefile):
+                result = evaluate(ast, env)
+    return unparse(result)
+
+
+def _backend(name):
+    """The evaluate function of the named backend. Any function evaluating
+    an AST in an environment, such as `Profiler.evaluate`, may be given in
+    place of a name."""
 
-    asts = parse_multiple(source)
-    results = [evaluate(ast, env) for ast in asts]
-    return unparse(results[-1])
+    if callable(name):
+        return name
+    if name not in BACKENDS:
+        raise DiyLangError("Unknown backend '%s', expected one of: %s"
+                           % (name, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[name]
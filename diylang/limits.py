@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from . import evaluator, interpreter
+from .types import LimitExceeded, Cons, String
+
+"""
+Limits on what a program may do, for running untrusted code.
+
+    limits = Limits(fuel=100000, max_depth=500, max_size=10000, timeout=2)
+    limits.interpret(source, env)
+
+ - `fuel` is the number of steps the program may take. Each special form,
+   primitive and function call is a step.
+ - `max_depth` is how deeply function calls may nest. Calls in tail position
+   don't nest, so a loop written with tail recursion runs for as long as the
+   fuel lasts.
+ - `max_size` is the greatest length of a list or string the program may
+   build, with `cons` or by calling builtins. The native list functions are
+   stopped before building a list that is too long, other builtins once they
+   return it.
+ - `timeout` is the number of seconds the program may run for. The clock is
+   looked at every `CLOCK_INTERVAL` steps, and by the native list functions
+   as they go through long lists (see `native.py`). Other long calls of
+   builtins, such as sorting a long list natively, are not interrupted.
+
+Limits left as None are not enforced. A program going beyond a limit is
+stopped with a LimitExceeded, which is a DiyLangError. So is a program
+running out of Python stack, before reaching `max_depth`, rather than with a
+RecursionError.
+
+A Limits is the budget of one program: the steps and time taken by all the
+code it runs add up, starting from the first call of `evaluate`. Functions
+called by builtins, such as the native list functions, are limited as well.
+
+Like the profiler, the limits are kept by code compiled for the purpose by
+`compile_monitored` in `evaluator.py`. Code run without limits is compiled as
+usual, with no checks at all. Only the closures backend can be limited.
+"""
+
+# How many steps to take between looking at the clock.
+CLOCK_INTERVAL = 1000
+
+
+class Limits(evaluator.Monitor):
+
+    def __init__(self, fuel=None, max_depth=None, max_size=None,
+                 timeout=None):
+        evaluator.Monitor.__init__(self)
+        self.fuel = fuel
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self.steps = 0
+        self.depth = 0
+        self.deadline = None
+        # The number of steps after which the fuel and clock are checked next.
+        self._checkpoint = 0
+
+        # The last list whose length was taken, and its length, so that
+        # building a list one `cons` at a time doesn't walk it every time.
+        self._last_list = None
+        self._last_length = 0
+
+    def evaluate(self, ast, env):
+        """Evaluate an AST in the environment, like `evaluator.evaluate`,
+        within the limits."""
+
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        code = evaluator.compile_monitored(ast, self)
+        try:
+            return evaluator.run_monitored(code, env, self)
+        except RecursionError:
+            raise LimitExceeded("Maximum recursion depth exceeded")
+
+    def interpret(self, source, env=None):
+        """Interpret a statement, like `interpreter.interpret`, within the
+        limits."""
+
+        return interpreter.interpret(source, env, self.evaluate)
+
+    def interpret_file(self, filename, env=None, cache=False):
+        """Interpret a file, like `interpreter.interpret_file`, within the
+        limits."""
+
+        return interpreter.interpret_file(filename, env, self.evaluate, cache)
+
+    #
+    # Called by the limited code
+    #
+
+    def form(self, name, code):
+        """Wrap the compiled code of a special form or primitive."""
+
+        step = self._step
+        if name == "cons" and self.max_size is not None:
+            check_size = self._check_size
+
+            def limited_cons(env):
+                step()
+                return check_size(code(env))
+            return limited_cons
+
+        def limited(env):
+            step()
+            return code(env)
+        return limited
+
+    def monitor_body(self, closure, code):
+        """The limited code of the body of a closure."""
+
+        step = self._step
+        max_depth = self.max_depth
+
+        if max_depth is None:
+            def limited(env):
+                step()
+                return code(env)
+        else:
+            def limited(env):
+                step()
+                self.depth += 1
+                try:
+                    if self.depth > max_depth:
+                        raise LimitExceeded(
+                            "Maximum recursion depth of %d exceeded"
+                            % max_depth)
+                    return code(env)
+                finally:
+                    self.depth -= 1
+        return limited
+
+    def call_builtin(self, builtin, args):
+        self._step()
+        return self._check_size(builtin.call(args))
+
+    def allocate(self, size):
+        """Called by builtins before building a list of `size` elements, and
+        with 0 while they work through long lists."""
+
+        if self.max_size is not None and size > self.max_size:
+            raise LimitExceeded("List longer than the maximum size of %d"
+                                % self.max_size)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise LimitExceeded("Timed out after %g seconds" % self.timeout)
+
+    def _step(self):
+        self.steps += 1
+        if self.steps > self._checkpoint:
+            self._check()
+
+    def _check(self):
+        if self.fuel is not None and self.steps > self.fuel:
+            raise LimitExceeded("Out of fuel after %d steps" % self.fuel)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise LimitExceeded("Timed out after %g seconds" % self.timeout)
+
+        checkpoint = float("inf")
+        if self.deadline is not None:
+            checkpoint = self.steps + CLOCK_INTERVAL
+        if self.fuel is not None:
+            checkpoint = min(checkpoint, self.fuel)
+        self._checkpoint = checkpoint
+
+    def _check_size(self, value):
+        """Returns the value, unless it is a list or string longer than
+        `max_size`."""
+
+        max_size = self.max_size
+        if max_size is None:
+            return value
+        cls = value.__class__
+        if cls is String:
+            if value.end - value.start > max_size:
+                raise LimitExceeded("String longer than the maximum size "
+                                    "of %d" % max_size)
+        elif cls is Cons or cls is list:
+            if self._length(value) > max_size:
+                raise LimitExceeded("List longer than the maximum size of %d"
+                                    % max_size)
+        return value
+
+    def _length(self, lst):
+        """The length of a list, or any length over `max_size` if longer."""
+
+        start = lst
+        length = 0
+        while lst.__class__ is Cons:
+            if lst is self._last_list:
+                length += self._last_length
+                break
+            length += 1
+            if length > self.max_size:
+                return length
+            lst = lst.tail
+        else:
+            length += len(lst)
+        self._last_list, self._last_length = start, length
+        return length
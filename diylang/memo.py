@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from functools import partial
+
+from . import evaluator
+from .types import DiyLangError, Builtin, Cons, Environment, String
+from .ast import is_closure, is_builtin, is_boolean, is_integer, is_list
+from .parser import unparse
+
+"""
+Memoization of DIY Lang functions.
+
+`(memoize fn)` returns a function which calls `fn`, and remembers the
+result for the arguments. When called again with equal arguments, the
+remembered result is returned instead. `(memoize fn limit)` remembers no more
+than `limit` results, forgetting the least recently used first. `(defn-memo
+name (params) body)` defines a memoized function, like `defn`.
+
+Arguments are compared structurally: atoms by value, strings by their
+characters, and lists by their elements. Only pure functions should be
+memoized, of course, as side effects are not repeated.
+
+`(memo-stats fn)` gives the list `(hits misses size)` of a memoized function:
+how many calls were answered from memory, how many were not, and how many
+results are remembered.
+
+`memoize` and `memo-stats` are Builtins, defined in an environment by
+`install`, so they can be passed around like any other function. The
+memoized functions are Builtins too, so both backends can call them. The
+function being memoized is called through the evaluator.
+"""
+
+DEFAULT_LIMIT = 1000
+
+
+class Memo(object):
+
+    """
+    The remembered results of a function, in order of use, along with the
+    counts of hits and misses. Calling it calls the function through the
+    memo.
+    """
+
+    def __init__(self, fn, limit):
+        self.fn = fn
+        self.limit = limit
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *args):
+        key = tuple(_key(arg) for arg in args)
+        results = self.results
+        try:
+            result = results[key]
+        except KeyError:
+            pass
+        except TypeError:
+            raise DiyLangError("Can't memoize call with arguments %s"
+                               % unparse(list(args)))
+        else:
+            self.hits += 1
+            results.move_to_end(key)
+            return result
+
+        self.misses += 1
+        result = evaluator.apply(self.fn, list(args))
+        if self.limit:
+            results[key] = result
+            results.move_to_end(key)
+            if len(results) > self.limit:
+                results.popitem(last=False)
+        return result
+
+
+def memoize(fn, limit=DEFAULT_LIMIT, name="memoized"):
+    """Returns a memoized version of the function `fn`."""
+
+    optional = 0
+    if is_closure(fn):
+        arity = len(fn.params)
+    elif is_builtin(fn):
+        arity = fn.arity
+        optional = fn.optional
+    else:
+        raise DiyLangError("%s is not a function" % unparse(fn))
+    if not is_integer(limit) or is_boolean(limit) or limit < 0:
+        raise DiyLangError("The limit of memoize must be a non-negative "
+                           "integer, got %s" % unparse(limit))
+    return Builtin(name, arity, Memo(fn, limit), optional)
+
+
+def memo_stats(fn):
+    if not is_builtin(fn) or not isinstance(fn.fn, Memo):
+        raise DiyLangError("%s is not a memoized function" % unparse(fn))
+    memo = fn.fn
+    return Cons(memo.hits, Cons(memo.misses, Cons(len(memo.results), [])))
+
+
+def _key(value):
+    """A hashable key for a value, equal for equal values. Lists become
+    tuples of the keys of their elements, while booleans and strings are
+    tagged with their type, to keep them apart from the integers and
+    symbols they would otherwise be equal to."""
+
+    if is_boolean(value):
+        return bool, value
+    if value.__class__ is String:
+        return String, value.val
+    if is_list(value):
+        return (list,) + tuple(_key(x) for x in value)
+    return value
+
+
+def install(env):
+    """Define `memoize` and `memo-stats` in `env`, replacing any existing
+    definitions of the same names."""
+
+    env.bindings["memoize"] = Builtin("memoize", 1, memoize, 1)
+    env.bindings["memo-stats"] = Builtin("memo-stats", 1, memo_stats)
+    Environment.version += 1
+
+
+# The special form `defn-memo` is compiled to a call of this builtin, rather
+# than of whatever `memoize` is in the environment
+def memoize_named(name):
+    """A builtin memoizing a function, giving the result the name."""
+    return Builtin("memoize", 1, partial(memoize, name=name))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from itertools import islice
+
+from .types import Builtin, Cons, Environment
+from .ast import is_list
+from .evaluator import apply, running_monitor
+from .primitives import PRIMITIVES
+
+"""
+Native versions of the list functions from `stdlib.diy`.
+
+In `stdlib.diy`, every element of a list costs several calls of DIY Lang
+closures. The functions here do the same work in Python loops. They are
+optional: `install` replaces the definitions from `stdlib.diy` in an
+environment with these, which is what the `--native` flag of the `repl`
+launcher does.
+
+The results, and the errors, are meant to be exactly those of `stdlib.diy`.
+Lists are walked directly, while anything else (such as strings) is walked
+with the same primitives as `stdlib.diy` uses, so they fail or succeed in the
+same way. Functions passed to `filter`, `map` and `reduce` are called through
+the evaluator, which can run closures created by either backend.
+
+When the code is monitored, such as by limits, the monitor is told of each
+list before it is built, and the lists are walked and built PART_SIZE
+elements at a time, letting the monitor look at the clock in between. So a
+limit on the size of lists or on the time stops `(range 1 10000000)` before
+the list is built, or while it is.
+"""
+
+# How many elements of a list are walked or built at a time, when the code is
+# monitored.
+PART_SIZE = 10000
+
+_cons = PRIMITIVES["cons"][1]
+_head = PRIMITIVES["head"][1]
+_tail = PRIMITIVES["tail"][1]
+_empty = PRIMITIVES["empty"][1]
+_add = PRIMITIVES["+"][1]
+_greater = PRIMITIVES[">"][1]
+
+
+def install(env):
+    """Define the native functions in `env`, replacing any existing
+    definitions of the same names."""
+
+    for name, (arity, fn) in NATIVES.items():
+        env.bindings[name] = Builtin(name, arity, fn)
+    Environment.version += 1
+
+
+def _items(lst):
+    """The elements of `lst` as a Python list, taking them the same way
+    `fold` from `stdlib.diy` would."""
+
+    if is_list(lst):
+        monitor = running_monitor()
+        if monitor is None:
+            return list(lst)
+        return _monitored_items(lst, monitor)
+    items = []
+    while not _empty(lst):
+        items.append(_head(lst))
+        lst = _tail(lst)
+    return items
+
+
+def _monitored_items(lst, monitor):
+    """The elements of the list `lst`, taken PART_SIZE at a time."""
+
+    items = []
+    elements = iter(lst)
+    while True:
+        part = list(islice(elements, PART_SIZE))
+        items.extend(part)
+        if len(part) < PART_SIZE:
+            return items
+        monitor.allocate(0)
+
+
+def _build(items):
+    """A list of `items`, which may be any sequence."""
+
+    lst = []
+    monitor = running_monitor()
+    if monitor is None:
+        for item in reversed(items):
+            lst = Cons(item, lst)
+        return lst
+
+    monitor.allocate(len(items))
+    for end in range(len(items), 0, -PART_SIZE):
+        for item in reversed(items[max(end - PART_SIZE, 0):end]):
+            lst = Cons(item, lst)
+        monitor.allocate(0)
+    return lst
+
+
+def _size(value):
+    """The length of `value` if it is a list, or else 0."""
+    return sum(1 for _ in value) if is_list(value) else 0
+
+
+def _length(lst):
+    return len(_items(lst))
+
+
+def _sum(lst):
+    total = 0
+    for x in _items(lst):
+        total = _add(total, x)
+    return total
+
+
+def _range(start, end):
+    if _greater(start, end):
+        return []
+    return _build(range(start, end + 1))
+
+
+def _reverse(lst):
+    items = _items(lst)
+    items.reverse()
+    return _build(items)
+
+
+def _append(xs, ys):
+    items = _items(xs)
+    monitor = running_monitor()
+    if monitor is not None:
+        monitor.allocate(len(items) + _size(ys))
+    for x in reversed(items):
+        ys = _cons(x, ys)
+    return ys
+
+
+def _filter(pred, lst):
+    return _build([x for x in _items(lst) if apply(pred, [x])])
+
+
+def _map(fn, lst):
+    return _build([apply(fn, [x]) for x in _items(lst)])
+
+
+def _reduce(fn, acc, lst):
+    for x in reversed(_items(lst)):
+        acc = apply(fn, [x, acc])
+    return acc
+
+
+def _sort(lst):
+    items = _items(lst)
+    # Compare each element with the first, as the first partitioning of the
+    # quicksort in `stdlib.diy` does, to fail with the same error.
+    for x in items[1:]:
+        _greater(x, items[0])
+    return _build(sorted(items))
+
+
+NATIVES = {
+    "length": (1, _length),
+    "sum": (1, _sum),
+    "range": (2, _range),
+    "reverse": (1, _reverse),
+    "append": (2, _append),
+    "filter": (2, _filter),
+    "map": (2, _map),
+    "reduce": (3, _reduce),
+    "sort": (1, _sort),
+}
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from .ast import kind_of, SYMBOL, INTEGER, BOOLEAN, STRING, LIST
+from .primitives import PRIMITIVES
+from .types import DiyLangError
+
+"""
+An optimisation pass over parsed ASTs, done before they are evaluated.
+
+    ast = optimize(parse("(if (> 2 1) (* 6 7) (undefined))"))   # 42
+
+`optimize` gives an AST evaluating to the same value as the one given, with
+the work that doesn't depend on the environment already done:
+
+ - quoted integers, booleans and strings are replaced by themselves, as
+   they evaluate to themselves anyway.
+ - calls of the primitives in `FOLDED`, with constant arguments, are
+   replaced by their result. Calls failing, such as `(/ 1 0)` or `(+ 1 #t)`,
+   are left for the error to be raised when they are run, as usual.
+ - an `if` with a constant predicate is replaced by the branch taken, and
+   the clauses of a `cond` which can never be reached are removed.
+
+Everything is done from the inside out, so `(if (eq (+ 1 1) 2) 'yes 'no)`
+becomes `'yes`. Primitives and special forms can't be redefined, so the
+names always mean the same thing. Lambda bodies and the values of `define`
+and `let` are optimised as well, but quoted data and anything else that is
+not evaluated is left as it is, as are malformed special forms, so that they
+fail in the same way.
+
+The ASTs given are not changed; the parts optimised are copied. The
+`--optimize` flag of the `repl` launcher optimises each expression of the
+program before running it, and `--dump-optimized` prints the result with
+`unparse` instead.
+"""
+
+# The primitives whose calls are folded. They have no side effects, and
+# give a value which can be written in the source.
+FOLDED = frozenset(["+", "-", "*", "/", "mod", ">", "eq", "atom"])
+
+# The kinds of ASTs which evaluate to themselves.
+_LITERALS = frozenset([INTEGER, BOOLEAN, STRING])
+
+_NOT_CONSTANT = object()
+
+
+def optimize(ast):
+    """The optimised version of an AST."""
+
+    if kind_of(ast) is not LIST or not ast:
+        return ast
+    head = ast[0]
+    if kind_of(head) is SYMBOL:
+        if head in _FORMS:
+            return _FORMS[head](ast)
+        if head in FOLDED:
+            return _fold(ast)
+    return [optimize(x) for x in ast]
+
+
+def _constant(ast):
+    """The value of an AST which always evaluates to the same value, or
+    _NOT_CONSTANT."""
+
+    kind = kind_of(ast)
+    if kind in _LITERALS:
+        return ast
+    if kind is LIST and len(ast) == 2 and ast[0] == "quote":
+        return ast[1]
+    return _NOT_CONSTANT
+
+
+def _fold(ast):
+    ast = [ast[0]] + [optimize(x) for x in ast[1:]]
+    arity, operation = PRIMITIVES[ast[0]]
+    if len(ast) != arity + 1:
+        return ast
+    args = [_constant(x) for x in ast[1:]]
+    if _NOT_CONSTANT in args:
+        return ast
+    try:
+        return operation(*args)
+    except DiyLangError:
+        return ast
+
+
+def _optimize_quote(ast):
+    if len(ast) == 2 and kind_of(ast[1]) in _LITERALS:
+        return ast[1]
+    return ast
+
+
+def _optimize_if(ast):
+    if len(ast) != 4:
+        return ast
+    predicate = optimize(ast[1])
+    value = _constant(predicate)
+    if value is _NOT_CONSTANT:
+        return [ast[0], predicate, optimize(ast[2]), optimize(ast[3])]
+    return optimize(ast[2] if value else ast[3])
+
+
+def _optimize_cond(ast):
+    if len(ast) != 2 or kind_of(ast[1]) is not LIST or not all(
+            kind_of(c) is LIST and len(c) == 2 for c in ast[1]):
+        return ast
+    clauses = []
+    for predicate, consequent in ast[1]:
+        predicate = optimize(predicate)
+        value = _constant(predicate)
+        if value is _NOT_CONSTANT:
+            clauses.append([predicate, optimize(consequent)])
+        elif value:
+            if not clauses:
+                return optimize(consequent)
+            # The clauses after this one are never reached.
+            clauses.append([True, optimize(consequent)])
+            return [ast[0], clauses]
+    if not clauses:
+        return False
+    return [ast[0], clauses]
+
+
+def _optimize_from(first):
+    """Optimizes the arguments of a special form from the `first` on."""
+
+    def optimize_form(ast):
+        return ast[:first] + [optimize(x) for x in ast[first:]]
+    return optimize_form
+
+
+def _optimize_lambda(ast):
+    if len(ast) != 3:
+        return ast
+    return [ast[0], ast[1], optimize(ast[2])]
+
+
+def _optimize_defn(ast):
+    if len(ast) != 4:
+        return ast
+    return [ast[0], ast[1], ast[2], optimize(ast[3])]
+
+
+def _optimize_let(ast):
+    if len(ast) != 3 or kind_of(ast[1]) is not LIST or not all(
+            kind_of(b) is LIST and len(b) == 2 for b in ast[1]):
+        return ast
+    bindings = [[name, optimize(value)] for name, value in ast[1]]
+    return [ast[0], bindings, optimize(ast[2])]
+
+
+_FORMS = {
+    "quote": _optimize_quote,
+    "if": _optimize_if,
+    "cond": _optimize_cond,
+    "define": _optimize_from(2),
+    "lambda": _optimize_lambda,
+    "defn": _optimize_defn,
+    "defn-memo": _optimize_defn,
+    "let": _optimize_let,
+}
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from . import evaluator
+from .types import DiyLangError, Builtin, Closure, Cons, Environment, \
+    Snapshot
+from .ast import is_closure, is_builtin, is_boolean, is_integer, is_list, \
+    is_symbol
+from .parser import unparse, parse_multiple
+
+"""
+Running DIY Lang code in parallel, in worker processes.
+
+`(pmap fn lst)` gives the same list as `(map fn lst)`, but `fn` is called in
+a pool of worker processes, one per CPU, several elements at a time.
+`(pmap fn lst chunk-size)` sends the elements to the workers `chunk-size`
+at a time; larger chunks cost less in sending, but spread the work less
+evenly. The default is to give each worker about four chunks. `pmap` is a
+Builtin, defined in an environment by `install`.
+
+The function is pickled once per call, along with the variables it may
+need of the environment it was created in (see `Closure.__getstate__`), and
+left in a temporary file for the workers; the chunks carry only its digest.
+Each worker unpickles it once, keeping the last few it has seen, so mapping
+the same function again is cheap as long as the variables it needs are
+unchanged. Anything the function defines or changes in its environment is
+done to the worker's copy, and lost. Calls of `pmap` within the workers, or
+from code being profiled or limited, are run sequentially.
+
+The pool is started on the first call, and reused for every call after that
+until `shutdown` is called. `multiprocessing` and `pickle` are only imported
+then as well, as they take longer to import than many programs take to run.
+
+`interpret_many` interprets a batch of independent programs, giving their
+results in order, with a `WorkerPool`: worker processes forked with a copy of
+an environment, such as one with the stdlib loaded. Each program is run in an
+environment of its own, forked from a frozen snapshot of the shared one (see
+`Environment.fork`), so what a program defines is only seen by that
+program. A `WorkerPool` can be kept to interpret any number of batches.
+"""
+
+# How many chunks to give each worker, by default.
+CHUNKS_PER_WORKER = 4
+
+# How many unpickled functions a worker keeps.
+KEPT_FUNCTIONS = 8
+
+_pool = None
+
+# Set in the worker processes
+_in_worker = False
+_functions = {}
+_env = None
+_evaluate = None
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def pmap(fn, lst, chunk_size=None):
+    if not is_closure(fn) and not is_builtin(fn):
+        raise DiyLangError("%s is not a function" % unparse(fn))
+    if not is_list(lst):
+        raise DiyLangError("The list of pmap must be a list, got %s"
+                           % unparse(lst))
+    if chunk_size is not None and (not is_integer(chunk_size) or
+                                   is_boolean(chunk_size) or chunk_size < 1):
+        raise DiyLangError("The chunk size of pmap must be a positive "
+                           "integer, got %s" % unparse(chunk_size))
+
+    items = list(lst)
+    # Monitored code, such as code being profiled or limited, is run here
+    # instead, where the monitor sees it.
+    if _in_worker or not items or evaluator.running_monitor() is not None:
+        return _build([evaluator.apply(fn, [item]) for item in items])
+
+    import hashlib
+    import tempfile
+    try:
+        payload = _dumps(fn)
+    except Exception as e:
+        raise DiyLangError("Can't send %s to the worker processes: %s"
+                           % (unparse(fn), e))
+    digest = hashlib.sha1(payload).hexdigest()
+    if chunk_size is None:
+        chunk_size = _chunk_size(len(items), default_workers())
+
+    # The function is left in a file for the workers, which read it the
+    # first time they see its digest, so the chunks carry only the items.
+    handle, path = tempfile.mkstemp(prefix="diylang-pmap-")
+    try:
+        with os.fdopen(handle, "wb") as payload_file:
+            payload_file.write(payload)
+        chunks = [(digest, path, items[i:i + chunk_size])
+                  for i in range(0, len(items), chunk_size)]
+        results = []
+        for chunk in _get_pool().map(_map_chunk, chunks, chunksize=1):
+            results.extend(chunk)
+    finally:
+        os.remove(path)
+    return _build(results)
+
+
+def shutdown():
+    """Stop the worker processes, if started."""
+
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def _dumps(fn):
+    """The function pickled, with only the variables it may need of the
+    environments it was created in.
+
+    Each environment reached is pickled as a copy holding only the names
+    occurring in the bodies of the closures pickled. Those names may bring
+    in more closures, and so more names, so it is pickled again until no
+    more are found. Frames are pickled as they are, as the code of the
+    closures made in them finds their variables by position."""
+
+    import copyreg
+    import io
+    import pickle
+
+    def reduce_closure(closure):
+        found.update(_symbols(closure.body))
+        return closure.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+    def reduce_environment(env):
+        bindings = dict((name, value) for name, value in env.bindings.items()
+                        if name in names)
+        return copyreg.__newobj__, (env.__class__,), \
+            (None, {"bindings": bindings, "parent": env.parent})
+
+    names = set()
+    while True:
+        found = set()
+        stream = io.BytesIO()
+        pickler = pickle.Pickler(stream, pickle.HIGHEST_PROTOCOL)
+        pickler.dispatch_table = copyreg.dispatch_table.copy()
+        pickler.dispatch_table[Closure] = reduce_closure
+        pickler.dispatch_table[Environment] = reduce_environment
+        pickler.dispatch_table[Snapshot] = reduce_environment
+        pickler.dump(fn)
+        if found <= names:
+            return stream.getvalue()
+        names |= found
+
+
+def _symbols(ast):
+    """The symbols occurring anywhere in an AST."""
+
+    if is_symbol(ast):
+        return [ast]
+    if is_list(ast):
+        return [symbol for x in ast for symbol in _symbols(x)]
+    return []
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        _pool = multiprocessing.Pool(default_workers(),
+                                     initializer=_start_worker)
+    return _pool
+
+
+def interpret_many(sources, env=None, workers=None, backend="closures",
+                   return_errors=False):
+    """Interpret each of the sources, giving a list of their results. See
+    `WorkerPool.interpret_many`."""
+
+    with WorkerPool(env, workers, backend) as pool:
+        return pool.interpret_many(sources, return_errors=return_errors)
+
+
+class WorkerPool(object):
+
+    """
+    Worker processes interpreting programs in copies of `env`, taken when
+    the workers are forked. Changes made to `env` after that are not seen
+    by the workers.
+    """
+
+    def __init__(self, env=None, workers=None, backend="closures"):
+        # Imported here, as the interpreter imports the evaluator, which
+        # imports this module. See above for multiprocessing.
+        import multiprocessing
+        from .interpreter import _backend
+        if env is None:
+            env = Environment()
+        evaluate = _backend(backend)
+        self.workers = workers or default_workers()
+        # Forked, rather than spawned, so the workers start with the
+        # environment as it is, without it being pickled.
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(self.workers, initializer=_start_worker,
+                                 initargs=(env.freeze(), evaluate))
+
+    def interpret_many(self, sources, chunk_size=None, return_errors=False):
+        """Interpret each source, a program of any number of expressions, in
+        an environment of its own. Gives a list of the results, each the
+        value of the last expression as a string, in the order of `sources`.
+
+        If a program fails, its error is raised once all have run, or with
+        `return_errors`, given in place of its result. This is usually a
+        DiyLangError, but may be a Python error such as a RecursionError."""
+
+        sources = list(sources)
+        if chunk_size is None:
+            chunk_size = _chunk_size(len(sources), self.workers)
+        results = self.pool.map(_interpret, sources, chunksize=chunk_size)
+        if not return_errors:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _chunk_size(count, workers):
+    """The default chunk size for `count` items, giving each worker about
+    CHUNKS_PER_WORKER chunks."""
+    return max(-(-count // (workers * CHUNKS_PER_WORKER)), 1)
+
+
+def _build(items):
+    lst = []
+    for item in reversed(items):
+        lst = Cons(item, lst)
+    return lst
+
+
+#
+# In the worker processes
+#
+
+
+def _start_worker(env=None, evaluate=None):
+    global _in_worker, _env, _evaluate
+    _in_worker = True
+    _env = env
+    _evaluate = evaluate
+
+
+def _map_chunk(chunk):
+    digest, path, items = chunk
+    fn = _functions.get(digest)
+    if fn is None:
+        import pickle
+        if len(_functions) >= KEPT_FUNCTIONS:
+            _functions.clear()
+        with open(path, "rb") as payload_file:
+            fn = _functions[digest] = pickle.load(payload_file)
+    return [evaluator.apply(fn, [item]) for item in items]
+
+
+def _interpret(source):
+    env = _env.fork()
+    try:
+        result = None
+        for ast in parse_multiple(source):
+            result = _evaluate(ast, env)
+        return unparse(result)
+    except Exception as e:
+        # Handed back rather than raised, so the other programs still run.
+        # Python errors too, such as a RecursionError, like the REPL.
+        return e
+
+
+def install(env):
+    """Define `pmap` in `env`, replacing any existing definition."""
+
+    env.bindings["pmap"] = Builtin("pmap", 2, pmap, 1)
+    Environment.version += 1
@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import re
-from .ast import is_boolean, is_list
-from .types import DiyLangError, String
+from .ast import kind_of, BOOLEAN, LIST
+from .types import DiyLangError, String, SYMBOLS, symbol
 
 """
-This is the parser module, with the `parse` function which you'll implement as
-part 1 of the workshop. Its job is to convert strings into data structures that
-the evaluator can understand.
+This is the parser module. Its job is to convert source into data structures
+that the evaluator can understand: `parse` reads a single expression,
+`parse_multiple` and `parse_stream` read any number of them, and `Reader`
+reads them from pieces of source as they arrive. `unparse` converts them
+back into source.
 """
 
 
@@ -15,12 +17,237 @@ def parse(source):
     """Parse string representation of one *single* expression
     into the corresponding Abstract Syntax Tree."""
 
-    raise NotImplementedError("DIY")
+    ast, end = read(source)
+    end = skip_space(source, end)
+    if end != len(source):
+        raise DiyLangError("Expected EOF, got: %s" % _excerpt(source, end))
+    return ast
 
 #
-# Below are a few useful utility functions. These should come in handy when
-# implementing `parse`. We don't want to spend the day implementing parenthesis
-# counting, after all.
+# The reader. A single regular expression splits the source into tokens, and
+# `read` walks them with a cursor, building lists on an explicit stack. This
+# way the source is scanned once, no matter how large or how deeply nested it
+# is, and no substrings are made except for the atoms themselves.
+#
+
+_TOKENS = re.compile(r"""
+      (?P<space>(?:\s+|;[^\n]*)+)
+    | (?P<open>\()
+    | (?P<close>\))
+    | (?P<quote>')
+    | (?P<string>"[^"\\]*(?:\\[\s\S][^"\\]*)*")
+    | (?P<unclosed>"[\s\S]*)
+    | (?P<atom>[^\s()'";]+)
+""", re.VERBOSE)
+
+_SPACE = re.compile(r"(?:\s+|;[^\n]*)+")
+
+# The characters of a string, up to the closing quote or an escape cut short
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\[\s\S][^"\\]*)*')
+
+_INTEGER = re.compile(r"-?[0-9]+$")
+
+_BOOLEANS = {"#t": True, "#f": False}
+
+_QUOTE = symbol("quote")
+
+
+def read(source, start=0):
+    """Read the first expression found in `source` from index `start`.
+
+    Returns a tuple (ast, end), where end is the index just past the
+    expression, so that reading can continue from there.
+    """
+
+    ast, end = Reader()._read(source, start, True)
+    if ast is _MORE:
+        raise DiyLangError(
+            "Incomplete expression: %s" % _excerpt(source, start))
+    return ast, end
+
+
+class Reader(object):
+
+    """
+    Incremental reader, for source arriving a piece at a time.
+
+    Text is handed to `feed`, which returns the top-level ASTs completed so
+    far. Lists still being read are kept on the reader's stack between calls,
+    so input is never scanned twice. Only a token which might continue in the
+    next piece (an atom, a string or a comment at the very end) is held back.
+
+    A string spanning many pieces is held back piece by piece, and each piece
+    is only searched for the closing quote. The string is read as a whole
+    once it is closed.
+    """
+
+    def __init__(self):
+        self.lists = []   # stack of (elements, quotes) for the open lists
+        self.quotes = 0   # number of quotes in front of the next expression
+        self.rest = ""    # unread text held back from the last piece
+        # The pieces of a string begun but not yet closed, held back instead
+        # of `rest`, and whether they end in the middle of an escape.
+        self.string = []
+        self.escaped = False
+        # The start of the expression being read, for error messages.
+        self.head = ""
+
+    @property
+    def pending(self):
+        """True if an expression has been started but not yet completed."""
+        return bool(self.lists or self.quotes or self.string or
+                    skip_space(self.rest) != len(self.rest))
+
+    def feed(self, text):
+        """Add text to the input, returning the list of completed ASTs."""
+
+        if self.string:
+            end = _STRING_BODY.match(text, 1 if self.escaped else 0).end()
+            if end == len(text) or text[end] != '"':
+                self.string.append(text)
+                self.escaped = end < len(text)
+                return []
+            text = self._take_string() + text
+        return self._read_all(self.rest + text, False)
+
+    def close(self):
+        """Signal end of input, returning the last completed ASTs.
+
+        Raises an error if the input ends in the middle of an expression."""
+
+        asts = self._read_all(self._take_string() + self.rest, True)
+        if self.lists or self.quotes:
+            raise DiyLangError(
+                "Incomplete expression: %s" % _excerpt(self.head, 0))
+        return asts
+
+    def _read_all(self, source, final):
+        asts = []
+        pos = 0
+        while True:
+            begun = self.lists or self.quotes
+            start = pos if begun else skip_space(source, pos)
+            ast, pos = self._read(source, pos, final)
+            if ast is _MORE:
+                if self.lists or self.quotes:
+                    # Enough of the expression read so far for an excerpt.
+                    head = self.head if begun else ""
+                    if len(head) < _HEAD_SIZE:
+                        head += source[start:min(pos, start + _HEAD_SIZE)]
+                    self.head = head[:_HEAD_SIZE]
+                rest = source[pos:]
+                if rest.startswith('"'):
+                    # Only the start of a string is held back unread.
+                    self.rest = ""
+                    self.string = [rest]
+                    self.escaped = \
+                        _STRING_BODY.match(rest, 1).end() < len(rest)
+                else:
+                    self.rest = rest
+                return asts
+            asts.append(ast)
+
+    def _take_string(self):
+        """The pieces of the string held back, as one text."""
+
+        text = "".join(self.string)
+        self.string = []
+        self.escaped = False
+        return text
+
+    def _read(self, source, pos, final):
+        """Read tokens from `pos` until a top-level expression is complete.
+
+        Returns the tuple (ast, end). If the source runs out first, `_MORE` is
+        returned in place of the AST, along with the index where reading
+        should resume once there is more text. Unless this is the `final`
+        piece of input, a token reaching the end of the source is left
+        unread, since it might not be complete yet."""
+
+        lists = self.lists
+        quotes = self.quotes
+        match_token = _TOKENS.match
+        symbols = SYMBOLS
+        size = len(source)
+
+        try:
+            while True:
+                match = match_token(source, pos)
+                if match is None:
+                    return _MORE, pos
+                kind = match.lastgroup
+                end = match.end()
+                if end == size and not final and kind in _UNFINISHED:
+                    return _MORE, pos
+                pos = end
+
+                if kind == "space":
+                    continue
+                elif kind == "open":
+                    lists.append(([], quotes))
+                    quotes = 0
+                    continue
+                elif kind == "quote":
+                    quotes += 1
+                    continue
+                elif kind == "close":
+                    if not lists or quotes:
+                        raise DiyLangError("Unexpected ')': %s" %
+                                           _excerpt(source, match.start()))
+                    ast, quotes = lists.pop()
+                elif kind == "atom":
+                    token = match.group()
+                    if token in _BOOLEANS:
+                        ast = _BOOLEANS[token]
+                    elif _INTEGER.match(token):
+                        ast = int(token)
+                    else:
+                        ref = symbols.get(token)
+                        ast = ref() if ref is not None else None
+                        if ast is None:
+                            ast = symbol(token)
+                elif kind == "string":
+                    ast = String(source[match.start() + 1:pos - 1])
+                else:
+                    raise DiyLangError("Unclosed string: %s" %
+                                       _excerpt(source, match.start()))
+
+                while quotes:
+                    ast = [_QUOTE, ast]
+                    quotes -= 1
+
+                if not lists:
+                    return ast, pos
+                lists[-1][0].append(ast)
+        finally:
+            self.quotes = quotes
+
+
+_MORE = object()
+
+_UNFINISHED = ("space", "atom", "unclosed")
+
+_HEAD_SIZE = 100
+
+CHUNK_SIZE = 64 * 1024
+
+
+def skip_space(source, start=0):
+    """Returns the index of the first character from `start` that is
+    neither whitespace nor part of a comment."""
+
+    match = _SPACE.match(source, start)
+    return match.end() if match else start
+
+
+def _excerpt(source, start, length=60):
+    """A short piece of the source from `start`, for use in error messages."""
+
+    text = source[start:start + length + 1].strip()
+    return text if len(text) <= length else text[:length] + "..."
+
+#
+# Utility functions for working with source text, built on `read`.
 #
 
 
@@ -34,17 +261,8 @@ def find_matching_paren(source, start=0):
     the index of the matching closing paren."""
 
     assert source[start] == '('
-    pos = start
-    open_brackets = 1
-    while open_brackets > 0:
-        pos += 1
-        if len(source) == pos:
-            raise DiyLangError("Incomplete expression: %s" % source[start:])
-        if source[pos] == '(':
-            open_brackets += 1
-        if source[pos] == ')':
-            open_brackets -= 1
-    return pos
+    _, end = read(source, start)
+    return end - 1
 
 
 def split_exps(source):
@@ -57,11 +275,12 @@ def split_exps(source):
         ["foo", "bar", "(baz 123)"]
     """
 
-    rest = source.strip()
     exps = []
-    while rest:
-        exp, rest = first_expression(rest)
-        exps.append(exp)
+    pos = skip_space(source)
+    while pos < len(source):
+        _, end = read(source, pos)
+        exps.append(source[pos:end])
+        pos = skip_space(source, end)
     return exps
 
 
@@ -70,23 +289,13 @@ def first_expression(source):
     first expression in the string and rest is the
     rest of the string after this expression."""
 
-    source = source.strip()
-
-    if source[0] == "'":
-        exp, rest = first_expression(source[1:])
-        return source[0] + exp, rest
-    elif source[0] == "(":
-        last = find_matching_paren(source)
-        return source[:last + 1], source[last + 1:]
-    else:
-        match = re.match(r"^[^\s)(']+", source)
-        end = match.end()
-        atom = source[:end]
-        return atom, source[end:]
+    start = skip_space(source)
+    _, end = read(source, start)
+    return source[start:end], source[end:]
 
 #
-# The functions below, `parse_multiple` and `unparse` are implemented in order
-# for the REPL to work. Don't worry about them when implementing the language.
+# Reading many expressions, from a string or a stream, and converting ASTs
+# back into source.
 #
 
 
@@ -101,20 +310,47 @@ def parse_multiple(source):
 
     """
 
-    source = remove_comments(source)
-    return [parse(exp) for exp in split_exps(source)]
+    asts = []
+    pos = skip_space(source)
+    while pos < len(source):
+        ast, end = read(source, pos)
+        asts.append(ast)
+        pos = skip_space(source, end)
+    return asts
+
+
+def parse_stream(stream, chunk_size=CHUNK_SIZE):
+    """Reads program source from a file, or any other object with a `read`
+    method returning text, yielding the ASTs one at a time.
+
+    The stream is consumed a chunk at a time, and each expression is yielded
+    as soon as it is complete, so that the whole source never needs to be in
+    memory at once.
+    """
+
+    reader = Reader()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        for ast in reader.feed(chunk):
+            yield ast
+    for ast in reader.close():
+        yield ast
 
 
 def unparse(ast):
     """Turns an AST back into DIY Lang program source"""
 
-    if is_boolean(ast):
+    kind = kind_of(ast)
+    if kind is BOOLEAN:
         return "#t" if ast else "#f"
-    elif is_list(ast):
-        if len(ast) > 0 and ast[0] == "quote":
-            return "'%s" % unparse(ast[1])
+    elif kind is LIST:
+        items = list(ast)
+        if len(items) > 0 and items[0] == "quote":
+            return "'%s" % unparse(items[1])
         else:
-            return "(%s)" % " ".join([unparse(x) for x in ast])
+            return "(%s)" % " ".join([unparse(x) for x in items])
     else:
         # integers or symbols (or lambdas)
         return str(ast)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from .types import DiyLangError, Cons, from_list
+from .ast import is_atom, is_list, is_string, kind_of, INTEGER, ATOM_KINDS
+from .parser import unparse
+
+"""
+The primitive operations of DIY Lang.
+
+These are not values in the environment, but rather built into the language
+itself, like the special forms. Unlike the special forms, all their arguments
+are evaluated before the operation is performed.
+
+`PRIMITIVES` maps the name of each operation to a tuple of its number of
+arguments and the Python function implementing it. They are shared by the
+evaluator and the virtual machine.
+"""
+
+
+def _arithmetic(operation):
+    def arithmetic(a, b):
+        # Plain ints are by far the most common, and need no lookup.
+        if a.__class__ is not int or b.__class__ is not int:
+            if kind_of(a) is not INTEGER or kind_of(b) is not INTEGER:
+                raise DiyLangError("Math operators only work on numbers, "
+                                   "got %s and %s" % (unparse(a), unparse(b)))
+        return operation(a, b)
+    return arithmetic
+
+
+def _divide(a, b):
+    if b == 0:
+        raise DiyLangError("Division by zero")
+    return a // b
+
+
+def _modulo(a, b):
+    if b == 0:
+        raise DiyLangError("Division by zero")
+    return a % b
+
+
+def _eq(a, b):
+    if a.__class__ is b.__class__:
+        # Nearly always the case. The same interned symbol is the same
+        # object, and needs no comparing.
+        return is_atom(a) and (a is b or a == b)
+    kind = kind_of(a)
+    return kind is kind_of(b) and kind in ATOM_KINDS and a == b
+
+
+def _cons(head, tail):
+    if is_list(tail):
+        return Cons(head, tail)
+    if is_string(tail) and is_string(head):
+        return tail.prepend(head)
+    raise DiyLangError("Can't cons %s onto %s" % (unparse(head),
+                                                  unparse(tail)))
+
+
+def _head(lst):
+    if lst.__class__ is Cons:
+        return lst.head
+    if is_list(lst) and lst:
+        return lst[0]
+    if is_string(lst) and not lst.is_empty():
+        return lst.head()
+    raise DiyLangError("Can't take head of %s" % unparse(lst))
+
+
+def _tail(lst):
+    if lst.__class__ is Cons:
+        return lst.tail
+    if is_list(lst) and lst:
+        # A Python list, from the parser or from outside the language. It is
+        # converted once, so the tails taken from the result are cheap.
+        return from_list(lst).tail
+    if is_string(lst) and not lst.is_empty():
+        return lst.tail()
+    raise DiyLangError("Can't take tail of %s" % unparse(lst))
+
+
+def _empty(lst):
+    if is_list(lst):
+        return not lst
+    if is_string(lst):
+        return lst.is_empty()
+    raise DiyLangError("Can't check whether %s is empty" % unparse(lst))
+
+
+PRIMITIVES = {
+    "atom": (1, is_atom),
+    "eq": (2, _eq),
+    "+": (2, _arithmetic(lambda a, b: a + b)),
+    "-": (2, _arithmetic(lambda a, b: a - b)),
+    "*": (2, _arithmetic(lambda a, b: a * b)),
+    "/": (2, _arithmetic(_divide)),
+    "mod": (2, _arithmetic(_modulo)),
+    ">": (2, _arithmetic(lambda a, b: a > b)),
+    "cons": (2, _cons),
+    "head": (1, _head),
+    "tail": (1, _tail),
+    "empty": (1, _empty),
+}
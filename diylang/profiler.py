@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+
+from . import evaluator, interpreter
+from .types import DiyLangError
+
+"""
+A profiler for DIY Lang programs, showing where the time goes.
+
+    profiler = Profiler()
+    profiler.interpret_file("program.diy", env)
+    print(profiler.report())
+    profiler.write_collapsed("program.folded")
+
+Code run by `Profiler.evaluate` is compiled with calls to the profiler around
+every function call, special form and primitive (see `compile_monitored` in
+`evaluator.py`). For each function, by the name it was defined with, and for
+each special form and primitive, the profiler counts the calls and measures:
+
+ - the inclusive time: from the start of a call until it returns, including
+   everything it calls. Recursive calls are only counted once, as part of
+   the outermost one.
+ - the exclusive time: the inclusive time, less that of the functions called.
+   For a special form or primitive, the time of any nested forms is left out
+   as well.
+ - the allocations: how many cons cells, closures and frames were created
+   during the calls, inclusively.
+
+A call in tail position ends the calling function, so the called function is
+counted as called by the caller's caller instead -- just as the Python stack
+never sees it. Functions called by builtins, such as memoized functions or
+the native list functions, are profiled as called by the builtin. The
+profiled code is slower than usual, by several times, and the
+times are only meaningful relative to each other.
+
+`write_collapsed` writes the time spent in each stack of function calls in the
+"collapsed" format of the FlameGraph tools, one stack per line:
+
+    <toplevel>;sort;filter 1520
+
+with the time in microseconds.
+
+Only the closures backend can be profiled.
+"""
+
+FUNCTION = "function"
+FORM = "form"
+
+# The name given to the code of the top-level expressions.
+TOPLEVEL = "<toplevel>"
+
+# The special forms and primitives creating a value each time: a closure,
+# the frame of a `let`, or a cons cell.
+ALLOCATING = frozenset(["lambda", "defn", "let", "cons"])
+
+# The columns the report can be sorted by.
+SORT_KEYS = ["exclusive", "inclusive", "calls", "allocations"]
+
+
+class Stats(object):
+
+    """The measurements of one function, special form or primitive."""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.allocations = 0
+        # The number of calls in progress. Only when the outermost ends are
+        # its time and allocations added to the inclusive totals.
+        self.active = 0
+
+
+class _Node(object):
+
+    """A function in the tree of function calls, with the time spent in it
+    exclusively when called through the functions above it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.time = 0.0
+        self.children = {}
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = _Node(name)
+        return node
+
+
+class Profiler(evaluator.Monitor):
+
+    def __init__(self, clock=time.perf_counter):
+        evaluator.Monitor.__init__(self)
+        self.clock = clock
+        self.stats = {}
+        self.allocations = 0
+        self.root = _Node(None)
+
+        # The calls in progress, innermost last, each a list of: the stats,
+        # the start time, the time of the calls within it to leave out of
+        # its exclusive time, the allocations at the start, and the call tree
+        # node to return to. The calls of functions are also kept apart.
+        self._calls = []
+        self._functions = []
+        self._node = self.root
+
+    def evaluate(self, ast, env):
+        """Evaluate an AST in the environment, like `evaluator.evaluate`,
+        while profiling."""
+
+        code = evaluator.compile_monitored(ast, self)
+        # The profiled code takes up to twice as much of the Python stack,
+        # which is allowed for, so programs can recurse as deep as usual.
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(2 * limit)
+        self._enter(FUNCTION, TOPLEVEL)
+        try:
+            return evaluator.run_monitored(code, env, self)
+        finally:
+            self._exit()
+            sys.setrecursionlimit(limit)
+
+    def interpret_file(self, filename, env=None, cache=False,
+                       optimize=False):
+        """Interpret a file, like `interpreter.interpret_file`, while
+        profiling."""
+
+        return interpreter.interpret_file(filename, env, self.evaluate, cache,
+                                          optimize)
+
+    #
+    # Reporting
+    #
+
+    def report(self, sort="exclusive", limit=None):
+        """A table of the measurements, largest first by the `sort` column,
+        with at most `limit` rows."""
+
+        if sort not in SORT_KEYS:
+            raise DiyLangError("Can't sort the profile by '%s', expected one "
+                               "of: %s" % (sort, ", ".join(SORT_KEYS)))
+        rows = sorted(self.stats.values(),
+                      key=lambda stats: (-getattr(stats, sort), stats.name))
+        if limit is not None:
+            rows = rows[:limit]
+
+        lines = ["%-24s %-8s %10s %14s %14s %12s" % (
+            "name", "kind", "calls", "inclusive ms", "exclusive ms",
+            "allocations")]
+        for stats in rows:
+            lines.append("%-24s %-8s %10d %14.3f %14.3f %12d" % (
+                stats.name, stats.kind, stats.calls, stats.inclusive * 1000,
+                stats.exclusive * 1000, stats.allocations))
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """The stacks of function calls, as lines of the collapsed format,
+        with the exclusive time of each in microseconds. Stacks taking less
+        than a microsecond are left out."""
+
+        lines = []
+        pending = [((), node) for node in self.root.children.values()]
+        while pending:
+            names, node = pending.pop()
+            names += (node.name,)
+            microseconds = int(round(node.time * 1e6))
+            if microseconds:
+                lines.append("%s %d" % (";".join(names), microseconds))
+            pending.extend((names, child)
+                           for child in node.children.values())
+        return sorted(lines)
+
+    def write_collapsed(self, filename):
+        with open(filename, "w") as output:
+            for line in self.collapsed():
+                output.write(line + "\n")
+
+    #
+    # Called by the profiled code
+    #
+
+    def form(self, name, code):
+        """Wrap the compiled code of a special form or primitive."""
+
+        enter, exit = self._enter, self._exit
+        allocates = name in ALLOCATING
+
+        def profiled(env):
+            enter(FORM, name)
+            if allocates:
+                self.allocations += 1
+            try:
+                return code(env)
+            finally:
+                exit()
+        return profiled
+
+    def monitor_body(self, closure, code):
+        """The profiled code of the body of a closure."""
+
+        name = closure.name or "lambda"
+        enter, exit = self._enter, self._exit
+
+        def profiled(env):
+            enter(FUNCTION, name)
+            # The frame the body runs in
+            self.allocations += 1
+            try:
+                return code(env)
+            finally:
+                exit()
+        return profiled
+
+    def call_builtin(self, builtin, args):
+        self._enter(FUNCTION, builtin.name)
+        try:
+            return builtin.call(args)
+        finally:
+            self._exit()
+
+    def allocate(self, size):
+        # The lists built by builtins are not counted as allocations.
+        pass
+
+    def _enter(self, kind, name):
+        stats = self.stats.get((kind, name))
+        if stats is None:
+            stats = self.stats[(kind, name)] = Stats(kind, name)
+        stats.calls += 1
+        stats.active += 1
+
+        call = [stats, 0.0, 0.0, self.allocations, self._node]
+        self._calls.append(call)
+        if kind == FUNCTION:
+            self._functions.append(call)
+            self._node = self._node.child(name)
+        # Last, to leave the profiler's own work out of the time.
+        call[1] = self.clock()
+
+    def _exit(self):
+        end = self.clock()
+        calls = self._calls
+        stats, start, inner, allocations, node = calls.pop()
+        elapsed = end - start
+
+        stats.exclusive += elapsed - inner
+        stats.active -= 1
+        if not stats.active:
+            stats.inclusive += elapsed
+            stats.allocations += self.allocations - allocations
+
+        if stats.kind == FUNCTION:
+            self._functions.pop()
+            self._node.time += elapsed - inner
+            self._node = node
+            if self._functions:
+                self._functions[-1][2] += elapsed
+        # Anything run within a form is left out of its exclusive time.
+        if calls and calls[-1][0].kind == FORM:
+            calls[-1][2] += elapsed
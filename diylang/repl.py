@@ -4,8 +4,9 @@ import os
 import sys
 
 from .types import DiyLangError, Environment
-from .parser import remove_comments
-from .interpreter import interpret
+from .parser import Reader, unparse
+from .interpreter import _backend
+from .optimizer import optimize as optimize_ast
 
 # importing this gives readline goodness when running on systems
 # where it is supported (i.e. UNIX-y systems)
@@ -21,7 +22,7 @@ except NameError:
     pass
 
 
-def repl(env=None):
+def repl(env=None, backend="closures", optimize=False):
     """Start the interactive Read-Eval-Print-Loop"""
 
     eof = "^Z" if sys.platform[0:3] == 'win' else "^D"
@@ -37,11 +38,14 @@ def repl(env=None):
 
     if env is None:
         env = Environment()
+    evaluate = _backend(backend)
 
     while True:
         try:
-            source = read_expression()
-            print(interpret(source, env))
+            for ast in read_expressions():
+                if optimize:
+                    ast = optimize_ast(ast)
+                print(unparse(evaluate(ast, env)))
         except DiyLangError as e:
             print(colored("!", "red"))
             print(faded(str(e.__class__.__name__) + ":"))
@@ -59,27 +63,22 @@ def repl(env=None):
             print(str(e))
 
 
-def read_expression():
-    """Read from stdin until we have at least one s-expression"""
-
-    exp = ""
-    open_parens = 0
-    while True:
-        line, parens = read_line(">  " if not exp.strip() else "…  ")
-        open_parens += parens
-        exp += line
-        if exp.strip() and open_parens <= 0:
-            break
-
-    return exp.strip()
+def read_expressions():
+    """Read from stdin until we have at least one s-expression, and none
+    left unfinished. Returns the ASTs read.
 
+    Each line is handed to a `Reader` from the parser as it is entered, so
+    the lines before it are never read again, and parens in strings and
+    comments are not taken for those of lists."""
 
-def read_line(prompt):
-    """Return tuple of user input line and number of unclosed parens"""
-
-    line = input(colored(prompt, "reset", "dark"))
-    line = remove_comments(line + "\n")
-    return line, line.count("(") - line.count(")")
+    reader = Reader()
+    asts = []
+    while True:
+        started = asts or reader.pending
+        line = input(colored("…  " if started else ">  ", "reset", "dark"))
+        asts.extend(reader.feed(line + "\n"))
+        if asts and not reader.pending:
+            return asts
 
 
 def colored(text, color, attr=None):
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .interpreter import _backend
+from .parser import Reader, unparse
+from .types import DiyLangError, Environment
+
+"""
+A server evaluating DIY Lang for other programs, over a local socket, so
+they don't pay for starting Python and loading the stdlib on every use.
+
+    server = Server(env)
+    asyncio.run(server.serve(port=7777))        # or path="/tmp/diylang.sock"
+
+or `./repl --serve 7777`. The environment, typically one with the stdlib
+loaded, is frozen when the server is made, and kept for as long as it runs.
+
+Each connection is a session, with an environment of its own forked from the
+frozen one (see `Environment.fork`), so what a session defines is only seen
+by that session, and starting a session costs next to nothing. The
+client sends source, a line at a time. As in the REPL, an expression may
+span lines, and a line may hold several expressions. Each expression is
+evaluated as soon as it is complete, and answered with a line of JSON:
+
+    {"value": "(1 2 3)"}
+    {"error": "Variable 'foo' is not defined", "type": "DiyLangError"}
+
+with the value `unparse`d. The answers come in the order of the expressions.
+Besides source, a line can be one of these commands:
+
+    :metrics    answered with {"metrics": {...}}, see `Metrics.snapshot`
+    :reset      answered with {"reset": true}, starting the session afresh
+
+The expressions are evaluated in a pool of threads, so a session running a
+long computation doesn't hold up the others. Because of the GIL, the threads
+take turns rather than run at once: the pool shares out the time, and
+doesn't add to it. For the same reason, code can't be evaluated by a
+profiler or with limits here, as their state is global while they run.
+
+The server only listens on localhost, or on a Unix socket, since anyone who
+can connect can run any code.
+"""
+
+# How many threads evaluate expressions, by default.
+DEFAULT_WORKERS = 4
+
+# The longest line a client may send, in bytes. The symbols read from the
+# clients are only kept while in use (see `SYMBOLS` in `types.py`), so new
+# names don't add up over the life of the server either.
+LINE_LIMIT = 2 ** 20
+
+# How many of the latest latencies are kept for the metrics.
+LATENCIES_KEPT = 1000
+
+HOST = "127.0.0.1"
+
+
+class Metrics(object):
+
+    """The counts and latencies of the expressions evaluated by a server."""
+
+    def __init__(self, clock=time.perf_counter, kept=LATENCIES_KEPT):
+        self.clock = clock
+        self.started = clock()
+        self.sessions = 0
+        self.active_sessions = 0
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=kept)
+
+    def record(self, seconds, error=False):
+        """Count an expression, answered after the given time."""
+
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.latencies.append(seconds)
+
+    def snapshot(self):
+        """The metrics as a dict, for sending as JSON. The throughput is in
+        expressions per second since the start, and the latencies are in
+        milliseconds, over the latest LATENCIES_KEPT expressions. The
+        latency of an expression is the time from when it is complete
+        until its answer is ready, including any waiting for a thread."""
+
+        uptime = self.clock() - self.started
+        latencies = sorted(self.latencies)
+        return {
+            "uptime": uptime,
+            "sessions": self.sessions,
+            "active_sessions": self.active_sessions,
+            "requests": self.requests,
+            "errors": self.errors,
+            "throughput": self.requests / uptime if uptime > 0 else 0.0,
+            "latency_ms": {
+                "mean": _mean(latencies) * 1000,
+                "p50": _percentile(latencies, 50) * 1000,
+                "p90": _percentile(latencies, 90) * 1000,
+                "p99": _percentile(latencies, 99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+
+
+class Server(object):
+
+    def __init__(self, env=None, workers=None, backend="closures"):
+        if env is None:
+            env = Environment()
+        self.env = env.freeze()
+        self.evaluate = _backend(backend)
+        self.workers = workers or DEFAULT_WORKERS
+        self.executor = ThreadPoolExecutor(self.workers)
+        self.metrics = Metrics()
+        self.server = None
+
+    async def start(self, port=0, path=None):
+        """Start listening on the port of localhost, or on the Unix socket
+        at `path` if given. Port 0 picks any free port, see `address`."""
+
+        if path is not None:
+            self.server = await asyncio.start_unix_server(
+                self._session, path, limit=LINE_LIMIT)
+        else:
+            self.server = await asyncio.start_server(
+                self._session, HOST, port, limit=LINE_LIMIT)
+
+    async def serve(self, port=0, path=None):
+        """Start listening, unless already started, and serve until
+        cancelled."""
+
+        if self.server is None:
+            await self.start(port, path)
+        try:
+            await self.server.serve_forever()
+        finally:
+            self.close()
+
+    @property
+    def address(self):
+        """The address listened on: (host, port), or the path of the
+        socket."""
+        return self.server.sockets[0].getsockname()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+    async def _session(self, stream, writer):
+        metrics = self.metrics
+        metrics.sessions += 1
+        metrics.active_sessions += 1
+        env = self.env.fork()
+        reader = Reader()
+        try:
+            while True:
+                try:
+                    line = (await stream.readline()).decode("utf-8")
+                except ValueError:
+                    # A line longer than LINE_LIMIT
+                    await _send(writer, {
+                        "error": "Line longer than %d bytes" % LINE_LIMIT,
+                        "type": "DiyLangError"})
+                    break
+                if not reader.pending and line.startswith(":"):
+                    command = line.strip()
+                    if command == ":reset":
+                        env = self.env.fork()
+                        reader = Reader()
+                        await _send(writer, {"reset": True})
+                    elif command == ":metrics":
+                        await _send(writer, {"metrics": metrics.snapshot()})
+                    else:
+                        await _send(writer, {
+                            "error": "Unknown command '%s'" % command,
+                            "type": "DiyLangError"})
+                    continue
+
+                try:
+                    asts = reader.feed(line) if line else reader.close()
+                except DiyLangError as e:
+                    # Whatever was read of the expression is dropped.
+                    reader = Reader()
+                    metrics.record(0.0, error=True)
+                    await _send(writer, _error(e))
+                    asts = []
+                for ast in asts:
+                    await _send(writer, await self._evaluate(ast, env))
+                if not line:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            metrics.active_sessions -= 1
+            writer.close()
+
+    async def _evaluate(self, ast, env):
+        start = time.perf_counter()
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._run, ast, env)
+        self.metrics.record(time.perf_counter() - start, "error" in response)
+        return response
+
+    def _run(self, ast, env):
+        """Evaluate an AST, in one of the threads, giving the answer."""
+
+        try:
+            return {"value": unparse(self.evaluate(ast, env))}
+        except Exception as e:
+            # Python errors too, such as a RecursionError, like the REPL.
+            return _error(e)
+
+
+def serve(env=None, port=0, path=None, workers=None, backend="closures"):
+    """Run a server until interrupted."""
+
+    server = Server(env, workers, backend)
+
+    async def run():
+        await server.start(port, path)
+        address = path or "%s:%d" % server.address[:2]
+        print("Serving DIY Lang on %s" % address, file=sys.stderr)
+        await server.serve()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def _error(e):
+    return {"error": str(e), "type": e.__class__.__name__}
+
+
+async def _send(writer, response):
+    writer.write(json.dumps(response).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def _percentile(values, percent):
+    """The value below which `percent` of the sorted values fall."""
+
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
@@ -3,38 +3,371 @@
 """
 This module holds some types we'll have use for along the way.
 
-It's your job to implement the Closure and Environment types.
-The DiyLangError class you can have for free :)
+Closures are the functions of DIY Lang, Builtins are functions implemented in
+Python, and Environments hold the variable bindings, each one linked to the
+enclosing (parent) environment. Lists built by running programs are chains
+of Cons cells. Symbols read by the parser are interned Symbols.
 """
 
+from itertools import zip_longest
+from weakref import KeyedRef
+
 
 class DiyLangError(Exception):
     """General DIY Lang error class."""
     pass
 
 
+class LimitExceeded(DiyLangError):
+    """Raised when a program goes beyond one of the limits it is run with,
+    see `limits.py`."""
+    pass
+
+
+class Symbol(str):
+
+    """
+    A symbol, as made by the parser.
+
+    Symbols are interned: `symbol` makes one Symbol for each name, and keeps
+    it in a table, so equal symbols are the same object. Comparing them, or
+    looking them up in a dict, is then a matter of comparing pointers rather
+    than characters. Plain Python strings are symbols too, so ASTs can be
+    written by hand, but the parser only makes Symbols.
+    """
+
+    # Weakly referenced from the table below
+    __slots__ = ("__weakref__",)
+
+    def __reduce__(self):
+        return symbol, (str(self),)
+
+
+# The table of all Symbols in use: weak references to them, by name. A
+# Symbol is only kept for as long as something else holds on to it, so that
+# reading code with ever new names, as a long-running server does, doesn't
+# fill up the table.
+SYMBOLS = {}
+
+
+def symbol(name):
+    """The Symbol for a name, the same one every time, for as long as the
+    Symbol is in use."""
+
+    ref = SYMBOLS.get(name)
+    sym = ref() if ref is not None else None
+    if sym is None:
+        sym = Symbol(name)
+        SYMBOLS[name] = KeyedRef(sym, _forget, name)
+    return sym
+
+
+def _forget(ref):
+    """Called once a Symbol is no longer in use."""
+    if SYMBOLS.get(ref.key) is ref:
+        del SYMBOLS[ref.key]
+
+
 class Closure(object):
 
-    def __init__(self, env, params, body):
-        raise NotImplementedError("DIY")
+    __slots__ = ("env", "params", "body", "code", "bytecode", "name")
+
+    def __init__(self, env, params, body, code=None):
+        self.env = env
+        self.params = params
+        self.body = body
+        # The compiled body, filled in by the evaluator on first call if not
+        # given. The AST in `body` is kept, since it is what the closure is.
+        self.code = code
+        # Likewise, the body compiled to bytecode for the virtual machine.
+        self.bytecode = None
+        # The name the closure was first defined with, if any, for reports
+        # such as those of the profiler.
+        self.name = None
+
+    def __getstate__(self):
+        # The compiled code can't be pickled, and is compiled again when the
+        # closure is first called after unpickling.
+        state = dict((slot, getattr(self, slot))
+                     for slot in self.__slots__)
+        state["code"] = None
+        state["bytecode"] = None
+        # No __dict__, only slots
+        return None, state
+
+    def moved(self, env):
+        """A copy of the closure, closing over another environment."""
+
+        closure = Closure(env, self.params, self.body, self.code)
+        closure.bytecode = self.bytecode
+        closure.name = self.name
+        return closure
 
     def __repr__(self):
         return "<closure/%d>" % len(self.params)
 
 
+class Builtin(object):
+
+    """
+    A function implemented in Python, which can be bound in an Environment
+    and called from DIY Lang like a closure. `fn` is called with the values
+    of the `arity` arguments, and of up to `optional` more, for which it
+    has defaults.
+    """
+
+    def __init__(self, name, arity, fn, optional=0):
+        self.name = name
+        self.arity = arity
+        self.fn = fn
+        self.optional = optional
+
+    def call(self, args):
+        if len(args) != self.arity and not \
+                self.arity < len(args) <= self.arity + self.optional:
+            raise DiyLangError("wrong number of arguments, expected %s got %d"
+                               % (self._arities(), len(args)))
+        return self.fn(*args)
+
+    def _arities(self):
+        """The numbers of arguments taken, such as `1` or `2-3`."""
+        if self.optional:
+            return "%d-%d" % (self.arity, self.arity + self.optional)
+        return str(self.arity)
+
+    def __repr__(self):
+        return "<builtin %s/%s>" % (self.name, self._arities())
+
+
 class Environment(object):
 
-    def __init__(self, variables=None):
+    __slots__ = ("bindings", "parent")
+
+    # Bumped whenever a variable is defined in any Environment, so the
+    # evaluator can tell whether what it looked up before is still what it
+    # would find. The variables of Frames are not counted.
+    version = 0
+
+    def __init__(self, variables=None, parent=None):
         self.bindings = variables if variables else {}
+        self.parent = parent
 
     def lookup(self, symbol):
-        raise NotImplementedError("DIY")
+        env = self
+        while env is not None:
+            if env.__class__ is not Frame:
+                bindings = env.bindings
+                if symbol in bindings:
+                    return bindings[symbol]
+            else:
+                value = env.local(symbol)
+                if value is not UNBOUND:
+                    return value
+            env = env.parent
+        raise DiyLangError("Variable '%s' is not defined" % symbol)
+
+    def local(self, symbol):
+        """The value bound to symbol in this environment itself (not looking
+        in the parents), or UNBOUND."""
+        return self.bindings.get(symbol, UNBOUND)
 
     def extend(self, variables):
-        raise NotImplementedError("DIY")
+        return Environment(dict(variables), self)
+
+    def set(self, symbol, value):
+        if symbol in self.bindings:
+            raise DiyLangError("Variable '%s' is already defined" % symbol)
+        self.bindings[symbol] = value
+        Environment.version += 1
+
+    def freeze(self):
+        """A frozen snapshot of this environment and the ones around it,
+        taking all their bindings as they are now. See `Snapshot`."""
+
+        envs = []
+        env = self
+        while env is not None:
+            envs.append(env)
+            env = env.parent
+
+        snapshot = Snapshot({})
+        bindings = snapshot.bindings
+        for env in reversed(envs):
+            bindings.update(env.bindings)
+        # The closures of frames are compiled to find their variables in
+        # frames, and so are left as they are.
+        moving = [env for env in envs if env.__class__ is not Frame]
+        # One copy of each closure, however many names it is bound to, so
+        # that they are still the same function.
+        moved = {}
+        for name, value in bindings.items():
+            if value.__class__ is Closure and any(value.env is env
+                                                 for env in moving):
+                if id(value) not in moved:
+                    moved[id(value)] = value.moved(snapshot)
+                bindings[name] = moved[id(value)]
+        return snapshot
+
+    def fork(self):
+        """A new, empty environment over a frozen snapshot of this one. What
+        is defined in it is only seen by it, and what is defined in this
+        environment afterwards is not seen at all.
+
+        Forking a Snapshot takes no time at all, while forking any other
+        environment takes a snapshot first. To make many environments alike,
+        freeze the environment once, and fork the snapshot."""
+
+        snapshot = self if self.__class__ is Snapshot else self.freeze()
+        return Environment({}, snapshot)
+
+
+class Snapshot(Environment):
+
+    """
+    A frozen copy of an environment, made by `Environment.freeze`, for
+    environments to share with `fork`. Nothing can be defined in it.
+
+    The closures bound in the environment are copied, so that they close
+    over the snapshot instead, each one once however many names it is bound
+    to. Those are not changed afterwards, but their compiled code is shared
+    with the originals, as are any closures made elsewhere, memos and other
+    values. Closures held inside other values, such as in a list or by a
+    memoized function, are not copied, and still see the original
+    environment, with whatever is defined in it later.
+    """
+
+    __slots__ = ()
 
     def set(self, symbol, value):
-        raise NotImplementedError("DIY")
+        raise DiyLangError("Can't define '%s' in a frozen environment"
+                           % symbol)
+
+    def freeze(self):
+        return self
+
+
+class Frame(Environment):
+
+    """
+    Environment for a function call or a `let`, with the values held in a
+    list rather than a dict.
+
+    The evaluator knows at compile time which names are bound in which frame,
+    and accesses the values directly by their position in the list. The
+    names are only needed for looking up variables by name, which is done by
+    code compiled without knowing about the frame. When a name occurs more
+    than once, the last one counts.
+    """
+
+    # The bindings of a frame are given by the property below instead of the
+    # slot of an Environment.
+    __slots__ = ("names", "values")
+
+    def __init__(self, names, values, parent):
+        self.names = names
+        self.values = values
+        self.parent = parent
+
+    @property
+    def bindings(self):
+        return dict((name, value)
+                    for name, value in zip(self.names, self.values)
+                    if value is not UNBOUND)
+
+    def __getstate__(self):
+        # Leaving out the `bindings` slot of an Environment, which would
+        # otherwise be pickled through the property, and can't be restored.
+        return None, {"names": self.names, "values": self.values,
+                      "parent": self.parent}
+
+    def local(self, symbol):
+        names = self.names
+        for i in range(len(names) - 1, -1, -1):
+            if names[i] == symbol:
+                return self.values[i]
+        return UNBOUND
+
+    def set(self, symbol, value):
+        names = self.names
+        for i in range(len(names) - 1, -1, -1):
+            if names[i] == symbol:
+                if self.values[i] is not UNBOUND:
+                    raise DiyLangError(
+                        "Variable '%s' is already defined" % symbol)
+                self.values[i] = value
+                return
+        raise DiyLangError("Can't define '%s' in this scope" % symbol)
+
+
+class _Unbound(object):
+
+    """The value of a name in a frame before it has been defined."""
+
+    def __repr__(self):
+        return "UNBOUND"
+
+    def __reduce__(self):
+        return "UNBOUND"
+
+
+UNBOUND = _Unbound()
+
+
+class Cons(object):
+
+    """
+    A list made by prepending `head` to the list `tail`.
+
+    Lists in DIY Lang are immutable, so a Cons cell can share its tail with
+    any number of other lists, and `cons`, `head` and `tail` are all done in
+    constant time. The tail is either another Cons cell or a Python list,
+    which is where the chain ends. The empty list is always `[]`, and the
+    lists from the parser are Python lists, so both kinds are lists to the
+    language and compare equal when they hold the same elements.
+    """
+
+    __slots__ = ("head", "tail")
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+
+    def __iter__(self):
+        lst = self
+        while lst.__class__ is Cons:
+            yield lst.head
+            lst = lst.tail
+        for item in lst:
+            yield item
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, Cons)):
+            return NotImplemented
+        for a, b in zip_longest(self, other, fillvalue=UNBOUND):
+            if a is UNBOUND or b is UNBOUND or a != b:
+                return False
+        return True
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickled flat, rather than one nested cell per element.
+        return from_list, (list(self),)
+
+    def __repr__(self):
+        return "Cons(%r)" % list(self)
+
+
+def from_list(items):
+    """Returns the elements of the Python list `items` as a chain of Cons
+    cells. Nested Python lists are converted too."""
+
+    lst = []
+    for item in reversed(items):
+        if item.__class__ is list:
+            item = from_list(item)
+        lst = Cons(item, lst)
+    return lst
 
 
 class String(object):
@@ -42,14 +375,70 @@ class String(object):
     """
     Simple data object for representing DIY Lang strings.
 
-    Ignore this until you start working on part 8.
+    A String is a view of the characters from `start` to `end` in a piece of
+    text, which may be shared with other Strings. Taking the head or tail of a
+    string makes a new view of the same text instead of copying it, so
+    walking through a string one character at a time is linear.
     """
 
-    def __init__(self, val=""):
-        self.val = val
+    # `_hash` is only set once the hash is first taken.
+    __slots__ = ("text", "start", "end", "_hash")
+
+    def __init__(self, val="", start=0, end=None):
+        self.text = val
+        self.start = start
+        self.end = len(val) if end is None else end
+
+    @property
+    def val(self):
+        """The characters of the string, as a Python string."""
+        if self.start == 0 and self.end == len(self.text):
+            return self.text
+        return self.text[self.start:self.end]
+
+    def is_empty(self):
+        return self.start == self.end
+
+    def head(self):
+        return String(self.text, self.start, self.start + 1)
+
+    def tail(self):
+        return String(self.text, self.start + 1, self.end)
+
+    def prepend(self, other):
+        """Returns `other` followed by this string. If the characters of
+        `other` already come right before this string in its text, the
+        result is a view of that text."""
+
+        size = other.end - other.start
+        if size <= self.start and \
+                self.text.startswith(other.val, self.start - size):
+            return String(self.text, self.start - size, self.end)
+        return String(other.val + self.val)
 
     def __str__(self):
         return '"{}"'.format(self.val)
 
     def __eq__(self, other):
-        return isinstance(other, String) and other.val == self.val
+        if not isinstance(other, String):
+            return False
+        if self.end - self.start != other.end - other.start:
+            return False
+        if self.text is other.text and self.start == other.start:
+            return True
+        return self.text.startswith(other.val, self.start, self.end)
+
+    def __getstate__(self):
+        # Without the cached hash, as the hashes of Python strings differ
+        # from one process to the next.
+        return None, {"text": self.text, "start": self.start,
+                      "end": self.end}
+
+    def __hash__(self):
+        # Strings are immutable, so the hash of the characters is only
+        # computed once.
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self.val)
+            return self._hash
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from .types import Environment, DiyLangError, Closure, Builtin
+from .ast import is_closure
+from .parser import unparse
+from .compiler import compile_program, compile_function, PRIMITIVE_TABLE, \
+    CONST, LOOKUP, PRIMITIVE, JUMP, JUMP_IF_FALSE, CALL, TAIL_CALL, RETURN, \
+    CLOSURE, DEFINE, ENTER, BIND, LEAVE, FAIL
+
+"""
+The virtual machine, running code from the bytecode compiler in
+`compiler.py`.
+
+It is an alternative to the evaluator, running the same language with the
+same environments and closures. Values are kept on a single value stack, and
+function calls push an explicit frame rather than recursing in Python, so the
+depth of recursion in DIY Lang is limited only by memory. Calls in tail
+position replace the current frame, and run in constant space.
+"""
+
+
+def evaluate(ast, env):
+    """Evaluate an Abstract Syntax Tree in the specified environment."""
+    return run(compile_program(ast), env)
+
+
+def run(code, env):
+    """Run compiled code in the specified environment, returning the
+    resulting value."""
+
+    stack = []
+    frames = []   # (code, pc, env) of each caller waiting for a return
+    push = stack.append
+    pop = stack.pop
+
+    instructions, constants, names = code.instructions, code.constants, \
+        code.names
+    pc = 0
+
+    while True:
+        op = instructions[pc]
+        arg = instructions[pc + 1]
+        pc += 2
+
+        if op == LOOKUP:
+            symbol = names[arg]
+            scope = env
+            while scope.__class__ is Environment:
+                bindings = scope.bindings
+                if symbol in bindings:
+                    push(bindings[symbol])
+                    break
+                scope = scope.parent
+            else:
+                # Frames from the evaluator, or no more environments
+                if scope is None:
+                    raise DiyLangError(
+                        "Variable '%s' is not defined" % symbol)
+                push(scope.lookup(symbol))
+
+        elif op == CONST:
+            push(constants[arg])
+
+        elif op == PRIMITIVE:
+            arity, operation = PRIMITIVE_TABLE[arg]
+            if arity == 1:
+                stack[-1] = operation(stack[-1])
+            else:
+                second = pop()
+                stack[-1] = operation(stack[-1], second)
+
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+
+        elif op == JUMP:
+            pc = arg
+
+        elif op == CALL or op == TAIL_CALL:
+            closure = stack[-arg - 1]
+            if closure.__class__ is not Closure or \
+                    arg != len(closure.params):
+                args = stack[len(stack) - arg:]
+                if closure.__class__ is Builtin:
+                    del stack[-arg - 1:]
+                    push(closure.call(args))
+                    if op == TAIL_CALL:
+                        # Return the result right away, as RETURN would.
+                        if not frames:
+                            return pop()
+                        code, pc, env = frames.pop()
+                        instructions, constants, names = code.instructions, \
+                            code.constants, code.names
+                    continue
+                _check_call(closure, args)
+            params = closure.params
+            if arg == 1:
+                variables = {params[0]: stack[-1]}
+            elif arg == 2:
+                variables = {params[0]: stack[-2], params[1]: stack[-1]}
+            else:
+                variables = dict(zip(params, stack[len(stack) - arg:]))
+            del stack[-arg - 1:]
+            callee = closure.bytecode
+            if callee is None:
+                callee = closure.bytecode = compile_function(params,
+                                                             closure.body)
+
+            if op == CALL:
+                frames.append((code, pc, env))
+            env = Environment(variables, closure.env)
+            code = callee
+            instructions, constants, names = code.instructions, \
+                code.constants, code.names
+            pc = 0
+
+        elif op == RETURN:
+            if not frames:
+                return pop()
+            code, pc, env = frames.pop()
+            instructions, constants, names = code.instructions, \
+                code.constants, code.names
+
+        elif op == CLOSURE:
+            function = constants[arg]
+            closure = Closure(env, function.params, function.body)
+            closure.bytecode = function
+            push(closure)
+
+        elif op == DEFINE:
+            value = pop()
+            if value.__class__ is Closure and value.name is None:
+                value.name = names[arg]
+            env.set(names[arg], value)
+            push(names[arg])
+
+        elif op == ENTER:
+            env = Environment({}, env)
+
+        elif op == BIND:
+            # Not a definition, so the version is left alone. The
+            # environment is new, and the evaluator only looks up names in
+            # it from the frames of functions, where lookups aren't cached.
+            env.bindings[names[arg]] = pop()
+
+        elif op == LEAVE:
+            env = env.parent
+
+        elif op == FAIL:
+            raise DiyLangError(constants[arg])
+
+        else:
+            raise DiyLangError("Unknown opcode %d" % op)
+
+
+def _check_call(closure, args):
+    """Raise the appropriate error if the call can not be made."""
+
+    if not is_closure(closure):
+        raise DiyLangError("%s is not a function" % unparse(closure))
+    if len(args) != len(closure.params):
+        raise DiyLangError("wrong number of arguments, expected %d got %d"
+                           % (len(closure.params), len(args)))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from diylang.interpreter import BACKENDS
+from diylang.parser import parse_multiple
+from diylang.types import Environment
+
+"""
+Helpers shared by the tests of the extensions to the language, for running
+tests with each backend and setting up environments.
+"""
+
+
+def with_each_backend(test):
+    """Make a test taking the name of a backend into one running it with
+    each of the backends in `interpreter.BACKENDS` in turn. An error is
+    reported along with the name of the backend it happened with."""
+
+    def run():
+        for backend in sorted(BACKENDS):
+            try:
+                test(backend)
+            except Exception as e:
+                raise AssertionError(
+                    "Failed with the %s backend: %s" % (backend, e)) from e
+
+    # Not `functools.wraps`, as the test runner would take the parameter
+    # of the wrapped test for a fixture.
+    run.__name__ = test.__name__
+    run.__doc__ = test.__doc__
+    return run
+
+
+def new_env(*modules, definitions=None, backend="closures"):
+    """A fresh environment, with the builtins of the given modules (such as
+    `memo`) installed, and the source in `definitions` run in it."""
+
+    env = Environment()
+    for module in modules:
+        module.install(env)
+    if definitions is not None:
+        evaluate = BACKENDS[backend]
+        for ast in parse_multiple(definitions):
+            evaluate(ast, env)
+    return env
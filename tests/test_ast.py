@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equals, assert_is, assert_is_none
+
+from diylang.ast import kind_of, is_atom, is_integer, SYMBOL, INTEGER, \
+    BOOLEAN, STRING, LIST, CLOSURE, BUILTIN
+from diylang.interpreter import interpret
+from diylang.types import Builtin, Closure, Cons, Environment, String, \
+    symbol
+
+"""
+Tests for the kinds of values and ASTs.
+"""
+
+
+def test_kind_of():
+    for value, kind in [
+            (symbol("x"), SYMBOL),
+            ("x", SYMBOL),
+            (42, INTEGER),
+            (True, BOOLEAN),
+            (False, BOOLEAN),
+            (String("x"), STRING),
+            ([], LIST),
+            (Cons(1, []), LIST),
+            (Closure(Environment(), [], 1), CLOSURE),
+            (Builtin("f", 0, lambda: 1), BUILTIN)]:
+        assert_is(kind, kind_of(value))
+
+
+def test_kind_of_subclasses_and_other_values():
+    class Flag(int):
+        pass
+
+    assert_is(INTEGER, kind_of(Flag(1)))
+    assert_is_none(kind_of(None))
+    assert_is_none(kind_of(1.5))
+
+
+def test_booleans_are_kept_apart_from_integers():
+    # Python's bool is an int, and is_integer says so, but the language
+    # keeps them apart.
+    assert_equals(True, is_integer(True))
+    assert_equals(True, is_atom(True))
+    assert_equals("#f", interpret("(eq #t 1)"))
+    assert_equals("#f", interpret("(eq 0 #f)"))
+    assert_equals("#t", interpret("(eq #f #f)"))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from os.path import join
+
+from nose.tools import assert_equals, assert_is, assert_is_none, \
+    assert_is_not_none, assert_raises
+
+from diylang.cache import load_environment, parse_file
+from diylang.interpreter import interpret, interpret_file
+from diylang.parser import parse_multiple
+from diylang.types import DiyLangError, Environment
+
+"""
+Tests for the caches of parsed files, and of environments loaded from files,
+used by the `repl` launcher.
+"""
+
+directory = None
+
+
+def setup_module():
+    global directory
+    directory = tempfile.mkdtemp()
+    os.environ["DIYLANG_CACHE"] = join(directory, "default-cache")
+
+
+def teardown_module():
+    del os.environ["DIYLANG_CACHE"]
+    shutil.rmtree(directory)
+
+
+def write(path, source):
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+
+def new_test_directory():
+    """A directory for the files of one test, and its cache directory."""
+    test_directory = tempfile.mkdtemp(dir=directory)
+    return test_directory, join(test_directory, "cache")
+
+
+def test_environment_is_loaded_from_cache_the_second_time():
+    files, cache = new_test_directory()
+    path = write(join(files, "lib.diy"), """
+        (define double (lambda (x) (* 2 x)))
+        (define twice double)
+        (define greeting "hello")
+        (define items '(1 (2 "three") #t))
+    """)
+
+    first = load_environment(path, directory=cache)
+    assert_equals(1, len(os.listdir(cache)))
+    second = load_environment(path, directory=cache)
+
+    assert_is_none(second.lookup("double").code)
+    assert_is(second, second.lookup("double").env)
+    assert_is(second.lookup("double"), second.lookup("twice"))
+    assert_equals("double", second.lookup("twice").name)
+    for env in (first, second):
+        assert_equals("84", interpret("(twice 42)", env))
+        assert_equals('"hello"', interpret("greeting", env))
+        assert_equals('(1 (2 "three") #t)', interpret("items", env))
+
+
+def test_changed_file_is_not_loaded_from_cache():
+    files, cache = new_test_directory()
+    path = write(join(files, "lib.diy"), "(define x 1)")
+    load_environment(path, directory=cache)
+    write(path, "(define x 2)")
+    env = load_environment(path, directory=cache)
+
+    assert_equals(2, env.lookup("x"))
+
+
+def test_broken_cache_files_are_ignored():
+    files, cache = new_test_directory()
+    path = write(join(files, "lib.diy"), "(define x 1)")
+    load_environment(path, directory=cache)
+    name, = os.listdir(cache)
+    write(join(cache, name), "garbage")
+    env = load_environment(path, directory=cache)
+
+    assert_equals(1, env.lookup("x"))
+
+
+def test_environments_with_unsupported_values_are_not_cached():
+    """Closures defined in other environments, such as inside a let, are not
+    saved. The file still loads, every time."""
+
+    files, cache = new_test_directory()
+    path = write(join(files, "lib.diy"),
+                 "(define f (let ((y 1)) (lambda (x) (+ x y))))")
+    env = load_environment(path, directory=cache)
+
+    assert_is_not_none(env.lookup("f"))
+    assert_equals(False, os.path.exists(cache))
+
+
+def test_definitions_before_a_failure_are_kept_but_not_cached():
+    files, cache = new_test_directory()
+    path = write(join(files, "lib.diy"),
+                 "(define x 1) (undefined) (define y 2)")
+    env = Environment()
+    with assert_raises(DiyLangError):
+        load_environment(path, directory=cache, env=env)
+
+    assert_equals({"x": 1}, env.bindings)
+    assert_equals(False, os.path.exists(cache))
+
+
+def test_parsed_file_is_loaded_from_cache_until_changed():
+    files, cache = new_test_directory()
+    source = '(define s "a string")\n(foo (bar #t -1) \'"quoted") ; comment'
+    path = write(join(files, "program.diy"), source)
+
+    assert_equals(parse_multiple(source), list(parse_file(path, cache)))
+    assert_equals(1, len(os.listdir(cache)))
+    assert_equals(parse_multiple(source), list(parse_file(path, cache)))
+
+    write(path, "(changed)")
+    assert_equals([["changed"]], list(parse_file(path, cache)))
+
+
+def test_interpret_file_with_cache():
+    files, _ = new_test_directory()
+    path = write(join(files, "program.diy"), """
+        (define fact (lambda (n) (if (eq n 0) 1 (* n (fact (- n 1))))))
+        (fact 5)
+    """)
+
+    for _ in range(2):
+        assert_equals("120", interpret_file(path, cache=True))
+    assert_equals(1, len(os.listdir(os.environ["DIYLANG_CACHE"])))
+
+
+def test_file_is_run_up_to_syntax_error_as_without_cache():
+    files, _ = new_test_directory()
+    path = write(join(files, "broken.diy"), "(define x 1)\n(oops")
+
+    env = Environment()
+    assert_raises(DiyLangError, interpret_file, path, env, cache=True)
+    assert_equals(1, env.lookup("x"))
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equals, assert_is, assert_is_instance, \
+    assert_raises_regexp
+
+from diylang.evaluator import compile_ast, evaluate
+from diylang.native import install
+from diylang.parser import parse
+from diylang.types import DiyLangError, Environment, Frame, UNBOUND
+
+"""
+The evaluator compiles each AST before running it. These tests check the
+parts of that which are not visible through the results alone.
+"""
+
+
+def test_compiled_code_can_be_run_repeatedly():
+    code = compile_ast(parse("(+ x 1)"))
+    assert_equals(2, code(Environment({"x": 1})))
+    assert_equals(11, code(Environment({"x": 10})))
+
+
+def test_closures_from_the_same_lambda_share_compiled_body():
+    env = Environment()
+    evaluate(parse("(define make (lambda (n) (lambda (x) (+ x n))))"), env)
+    first = evaluate(parse("(make 1)"), env)
+    second = evaluate(parse("(make 2)"), env)
+
+    assert_is(first.code, second.code)
+    assert_equals(11, evaluate([first, 10], env))
+    assert_equals(12, evaluate([second, 10], env))
+
+
+def test_errors_in_malformed_forms_are_raised_only_when_run():
+    code = compile_ast(parse("(if (eq x 0) 42 (define))"))
+    assert_equals(42, code(Environment({"x": 0})))
+
+    with assert_raises_regexp(DiyLangError, "Wrong number of arguments"):
+        code(Environment({"x": 1}))
+
+
+def test_tail_calls_run_in_constant_stack_depth():
+    """Calls in tail position of if, cond and let are made without growing
+    the Python stack, so tail recursion can go (much) deeper than the
+    recursion limit."""
+
+    env = Environment()
+    evaluate(parse("""
+        (define count-down
+            (lambda (n)
+                (if (eq n 0)
+                    'done
+                    (let ((m (- n 1)))
+                        (cond (((eq m -1) 'never)
+                               (#t (count-down m))))))))
+    """), env)
+    assert_equals("done", evaluate(parse("(count-down 100000)"), env))
+
+
+def test_mutually_recursive_tail_calls():
+    env = Environment()
+    evaluate(parse("""
+        (define is-even
+            (lambda (n) (if (eq n 0) #t (is-odd (- n 1)))))
+    """), env)
+    evaluate(parse("""
+        (define is-odd
+            (lambda (n) (if (eq n 0) #f (is-even (- n 1)))))
+    """), env)
+    assert_equals(True, evaluate(parse("(is-even 50000)"), env))
+
+
+def test_function_arguments_are_bound_in_frames():
+    env = Environment()
+    evaluate(parse("(define f (lambda (x y) (lambda () (+ x y))))"), env)
+    inner = evaluate(parse("(f 1 2)"), env)
+
+    assert_is_instance(inner.env, Frame)
+    assert_equals([1, 2], inner.env.values)
+    assert_equals(3, evaluate([inner], env))
+
+
+def test_let_binding_may_refer_to_outer_variable_of_same_name():
+    env = Environment()
+    evaluate(parse("(define f (lambda (x) (let ((x (+ x 1)) (y x)) y)))"),
+             env)
+    assert_equals(2, evaluate(parse("(f 1)"), env))
+
+
+def test_define_inside_function_body_binds_in_its_frame():
+    env = Environment()
+    evaluate(parse("""
+        (define f
+            (lambda (x)
+                (let ((dummy (define double (+ x x))))
+                    double)))
+    """), env)
+    assert_equals(8, evaluate(parse("(f 4)"), env))
+    with assert_raises_regexp(DiyLangError, "not defined"):
+        evaluate(parse("double"), env)
+
+
+def test_lambdas_in_let_see_later_bindings():
+    env = Environment()
+    result = evaluate(parse("""
+        (let ((get (lambda () later))
+              (later 42))
+            (get))
+    """), env)
+    assert_equals(42, result)
+
+
+def test_call_sites_see_new_definitions():
+    env = Environment()
+    code = compile_ast(parse("(f)"))
+    with assert_raises_regexp(DiyLangError, "not defined"):
+        code(env)
+    evaluate(parse("(define f (lambda () 1))"), env)
+    assert_equals(1, code(env))
+
+    # Shadowed in a fork, having been cached from the snapshot
+    fork = env.fork()
+    assert_equals(1, code(fork))
+    evaluate(parse("(define f (lambda () 2))"), fork)
+    assert_equals(2, code(fork))
+    assert_equals(1, code(env))
+
+
+def test_call_sites_shared_by_environments_look_in_each():
+    env = Environment()
+    evaluate(parse("(define call-g (lambda () (g)))"), env)
+    snapshot = env.freeze()
+    evaluate(parse("(define g (lambda () 'defined-later))"), env)
+
+    # The closures share the same compiled body, and call site.
+    assert_equals("defined-later", evaluate(parse("(call-g)"), env))
+    with assert_raises_regexp(DiyLangError, "'g' is not defined"):
+        evaluate(parse("(call-g)"), snapshot.fork())
+
+
+def test_call_sites_in_frames_see_new_definitions():
+    env = Environment()
+    evaluate(parse("(define f (lambda () 1))"), env)
+    frame = Frame(["f"], [UNBOUND], env)
+    code = compile_ast(parse("(f)"))
+    assert_equals(1, code(frame))
+    frame.set("f", evaluate(parse("(lambda () 2)"), frame))
+    assert_equals(2, code(frame))
+
+
+def test_installing_natives_bumps_the_version():
+    version = Environment.version
+    install(Environment())
+    assert_equals(True, Environment.version > version)
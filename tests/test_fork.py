@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equals, assert_is, assert_raises_regexp
+
+from diylang.interpreter import interpret
+from diylang.types import DiyLangError, Environment, Snapshot
+
+from helpers import new_env, with_each_backend
+
+"""
+Tests for environments forked from a frozen snapshot of another, with
+`Environment.fork`.
+"""
+
+
+DEFINITIONS = """
+    (define greeting 'hello)
+    (define greet (lambda (name) (cons greeting (cons name '()))))
+"""
+
+
+def shared_env(backend):
+    return new_env(definitions=DEFINITIONS, backend=backend)
+
+
+@with_each_backend
+def test_forks_see_the_bindings_but_keep_their_definitions(backend):
+    env = shared_env(backend)
+    first, second = env.fork(), env.fork()
+
+    interpret("(define name 'ann)", first, backend)
+    interpret("(define name 'bob)", second, backend)
+    assert_equals("(hello ann)", interpret("(greet name)", first, backend))
+    assert_equals("(hello bob)", interpret("(greet name)", second,
+                                           backend))
+    with assert_raises_regexp(DiyLangError, "not defined"):
+        interpret("name", env, backend)
+
+
+@with_each_backend
+def test_forks_may_shadow_the_snapshot(backend):
+    fork = shared_env(backend).fork()
+    interpret("(define greeting 'bye)", fork, backend)
+    assert_equals("bye", interpret("greeting", fork, backend))
+    # Functions from the snapshot still see the snapshot's bindings
+    assert_equals("(hello x)", interpret("(greet 'x)", fork, backend))
+
+
+@with_each_backend
+def test_later_changes_to_the_environment_are_not_seen(backend):
+    env = shared_env(backend)
+    fork = env.fork()
+    interpret("(define late 42)", env, backend)
+    with assert_raises_regexp(DiyLangError, "not defined"):
+        interpret("late", fork, backend)
+
+
+def test_closures_are_moved_to_the_snapshot():
+    env = shared_env("closures")
+    snapshot = env.freeze()
+    greet = snapshot.lookup("greet")
+    assert_is(snapshot, greet.env)
+    assert_equals("greet", greet.name)
+    assert_is(env, env.lookup("greet").env)
+
+
+@with_each_backend
+def test_aliases_stay_the_same_closure(backend):
+    env = shared_env(backend)
+    interpret("(define hi greet)", env, backend)
+    fork = env.fork()
+
+    assert_equals("#t", interpret("(eq greet hi)", fork, backend))
+    assert_is(fork.lookup("greet"), fork.lookup("hi"))
+
+
+@with_each_backend
+def test_closures_inside_values_see_the_original_environment(backend):
+    env = Environment()
+    interpret("(define getters (cons (lambda () late) '()))", env,
+              backend)
+    fork = env.fork()
+    interpret("(define late 42)", env, backend)
+
+    assert_is(env, fork.lookup("getters").head.env)
+    assert_equals("42", interpret("((head getters))", fork, backend))
+
+
+@with_each_backend
+def test_snapshots_are_frozen(backend):
+    snapshot = shared_env(backend).freeze()
+    with assert_raises_regexp(DiyLangError, "frozen environment"):
+        interpret("(define x 1)", snapshot, backend)
+    assert_is(snapshot, snapshot.freeze())
+
+
+def test_forking_a_snapshot_shares_it():
+    snapshot = Environment({"x": 1}, Environment({"y": 2})).freeze()
+    assert_equals({"x": 1, "y": 2}, snapshot.bindings)
+    first, second = snapshot.fork(), snapshot.fork()
+    assert_is(snapshot, first.parent)
+    assert_is(snapshot, second.parent)
+    assert_equals({}, first.bindings)
+    assert_equals(Snapshot, snapshot.__class__)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from nose.tools import assert_equals, assert_true, assert_is, \
+    assert_raises_regexp
+
+from diylang import memo, native
+from diylang.interpreter import interpret
+from diylang.limits import Limits
+from diylang.types import DiyLangError, LimitExceeded
+
+from helpers import new_env
+
+"""
+Tests for running programs within limits on their steps, depth of
+recursion, size of lists and strings, and time.
+"""
+
+DEFINITIONS = """
+    (define loop (lambda (n) (loop (+ n 1))))
+    (define deep (lambda (n) (if (eq n 0) 0 (+ 1 (deep (- n 1))))))
+    (define build
+        (lambda (n acc)
+            (if (eq n 0)
+                acc
+                (build (- n 1) (cons n acc)))))
+    (define double (lambda (s) (cons s s)))
+"""
+
+
+def test_limit_exceeded_is_a_diylang_error():
+    assert_true(issubclass(LimitExceeded, DiyLangError))
+
+
+def test_fuel():
+    env = new_env(definitions=DEFINITIONS)
+    with assert_raises_regexp(LimitExceeded, "Out of fuel after 1000 steps"):
+        Limits(fuel=1000).interpret("(loop 0)", env)
+
+    limits = Limits(fuel=1000)
+    assert_equals("10", limits.interpret("(deep 10)", env))
+    assert_true(0 < limits.steps < 1000)
+
+
+def test_fuel_adds_up_over_the_program():
+    env = new_env(definitions=DEFINITIONS)
+    limits = Limits()
+    limits.interpret("(deep 5)", env)
+
+    limits = Limits(fuel=3 * limits.steps)
+    for _ in range(3):
+        limits.interpret("(deep 5)", env)
+    with assert_raises_regexp(LimitExceeded, "Out of fuel"):
+        limits.interpret("(deep 5)", env)
+
+
+def test_max_depth():
+    env = new_env(definitions=DEFINITIONS)
+    assert_equals("50", Limits(max_depth=51).interpret("(deep 50)", env))
+    with assert_raises_regexp(LimitExceeded, "depth of 50 exceeded"):
+        Limits(max_depth=50).interpret("(deep 50)", env)
+
+    # Tail calls don't nest
+    assert_equals("(1 2 3)",
+                  Limits(max_depth=2).interpret("(build 3 '())", env))
+
+
+def test_running_out_of_python_stack_is_a_limit():
+    with assert_raises_regexp(LimitExceeded, "recursion depth exceeded"):
+        Limits().interpret("(deep 100000)", new_env(definitions=DEFINITIONS))
+
+
+def test_max_size():
+    env = new_env(definitions=DEFINITIONS)
+    assert_equals(3, len(Limits(max_size=3).interpret("(build 3 '())", env)
+                         .split()))
+    with assert_raises_regexp(LimitExceeded, "List longer than the maximum "
+                                             "size of 3"):
+        Limits(max_size=3).interpret("(build 4 '())", env)
+    with assert_raises_regexp(LimitExceeded, "String longer than the maximum "
+                                             "size of 100"):
+        Limits(max_size=100).interpret(
+            '(double (double (double (double (double "abcd")))))', env)
+
+
+def test_max_size_of_lists_from_builtins():
+    env = new_env(definitions=DEFINITIONS)
+    interpret("(define range (lambda (a b) '()))", env)
+    native.install(env)
+
+    with assert_raises_regexp(LimitExceeded, "List longer"):
+        Limits(max_size=100).interpret("(range 1 101)", env)
+
+
+def test_native_functions_are_stopped_before_building_long_lists():
+    env = new_env(definitions=DEFINITIONS)
+    native.install(env)
+
+    start = time.monotonic()
+    with assert_raises_regexp(LimitExceeded, "List longer"):
+        Limits(max_size=100).interpret("(range 1 100000000)", env)
+    assert_true(time.monotonic() - start < 1)
+    with assert_raises_regexp(LimitExceeded, "List longer"):
+        Limits(max_size=100).interpret(
+            "(append (range 1 60) (range 1 60))", env)
+
+
+def test_native_functions_are_timed_out():
+    env = new_env(definitions=DEFINITIONS)
+    native.install(env)
+
+    start = time.monotonic()
+    with assert_raises_regexp(LimitExceeded, "Timed out"):
+        Limits(timeout=0.1).interpret("(range 1 100000000)", env)
+    assert_true(time.monotonic() - start < 1)
+
+
+def test_timeout():
+    env = new_env(definitions=DEFINITIONS)
+    start = time.monotonic()
+    with assert_raises_regexp(LimitExceeded, "Timed out after 0.1 seconds"):
+        Limits(timeout=0.1).interpret("(loop 0)", env)
+    assert_true(time.monotonic() - start < 1)
+
+
+def test_functions_called_by_builtins_are_limited():
+    env = new_env(definitions=DEFINITIONS)
+    memo.install(env)
+    interpret("(define f (memoize (lambda (n) (loop n))))", env)
+
+    with assert_raises_regexp(LimitExceeded, "Out of fuel"):
+        Limits(fuel=1000).interpret("(f 1)", env)
+
+
+def test_unlimited_code_is_unchanged():
+    env = new_env(definitions=DEFINITIONS)
+    code = env.lookup("deep").code
+    Limits(fuel=1000).interpret("(deep 10)", env)
+
+    # The closures keep no code compiled with the limits
+    assert_is(code, env.lookup("deep").code)
+    assert_equals("100", interpret("(deep 100)", env))
+
+
+def test_code_compiled_alongside_limits_in_another_thread_is_unlimited():
+    compiling = threading.Event()
+    done = threading.Event()
+
+    class SlowLimits(Limits):
+        def form(self, name, code):
+            # Keep the limits compiling until the other thread is done.
+            compiling.set()
+            done.wait(10)
+            return Limits.form(self, name, code)
+
+    env = new_env(definitions=DEFINITIONS)
+    limited = threading.Thread(
+        target=SlowLimits(fuel=1).interpret, args=("(+ 1 2)", env))
+    limited.start()
+    try:
+        compiling.wait(10)
+        interpret("(define inc (lambda (n) (+ n 1)))", env)
+        assert_equals("2", interpret("(inc 1)", env))
+    finally:
+        done.set()
+        limited.join()
+
+    assert_equals("2", interpret("(inc 1)", env))
+    assert_equals("10", interpret("(deep 10)", env))
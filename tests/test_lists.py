@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+from nose.tools import assert_equals, assert_is, assert_is_instance, \
+    assert_not_equal
+
+from diylang.evaluator import evaluate
+from diylang.interpreter import interpret
+from diylang.parser import parse, unparse
+from diylang.types import Environment, Cons, from_list
+
+"""
+Lists built at run time are chains of `Cons` cells, sharing their tails. These
+tests check that they still work together with the Python lists produced by
+the parser.
+"""
+
+
+def test_cons_shares_the_tail():
+    env = Environment({"lst": from_list([1, 2, 3])})
+    result = evaluate(parse("(cons 0 lst)"), env)
+
+    assert_is_instance(result, Cons)
+    assert_is(env.lookup("lst"), result.tail)
+    assert_is(env.lookup("lst"), evaluate(parse("(tail (cons 0 lst))"), env))
+
+
+def test_quoted_lists_are_built_as_cons_cells():
+    result = evaluate(parse("'(1 (2 3) ())"), Environment())
+
+    assert_is_instance(result, Cons)
+    assert_is_instance(result.tail.head, Cons)
+    assert_equals([1, [2, 3], []], result)
+
+
+def test_cons_lists_compare_equal_to_python_lists():
+    assert_equals([1, 2, 3], Cons(1, Cons(2, [3])))
+    assert_equals(Cons(1, Cons(2, [3])), [1, 2, 3])
+    assert_equals(from_list([1, [2]]), Cons(1, [[2]]))
+    assert_not_equal([1, 2], Cons(1, [2, 3]))
+    assert_not_equal(Cons(1, [2, 3]), Cons(1, [2]))
+    assert_not_equal(Cons(1, []), 1)
+
+
+def test_tail_of_python_list():
+    env = Environment({"lst": [1, 2, 3]})
+    assert_equals([2, 3], evaluate(parse("(tail lst)"), env))
+    assert_equals(True, evaluate(parse("(empty (tail (tail (tail lst))))"),
+                                 env))
+
+
+def test_unparse_cons_list():
+    assert_equals("(1 '(a #t) ())", unparse(from_list(
+        [1, ["quote", ["a", True]], []])))
+
+
+def test_long_lists():
+    """Lists are walked iteratively, so long ones can be compared, printed
+    and pickled without hitting the recursion limit."""
+
+    env = Environment()
+    evaluate(parse("""
+        (define build
+            (lambda (n acc)
+                (if (eq n 0) acc (build (- n 1) (cons n acc)))))
+    """), env)
+    lst = evaluate(parse("(build 50000 '())"), env)
+
+    assert_equals(list(range(1, 50001)), lst)
+    assert_equals(lst, pickle.loads(pickle.dumps(lst)))
+    assert_equals("(1 2 3)", interpret("(build 3 '())", env))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equals, assert_raises_regexp
+
+from diylang import memo
+from diylang.interpreter import interpret
+from diylang.types import DiyLangError, Environment
+
+from helpers import new_env, with_each_backend
+
+"""
+Tests for memoized functions, made with `memoize` and `defn-memo`.
+"""
+
+
+@with_each_backend
+def test_defn_memo_remembers_results(backend):
+    env = new_env(memo)
+    interpret("""
+        (defn-memo fib (n)
+            (if (> 2 n)
+                n
+                (+ (fib (- n 1)) (fib (- n 2)))))
+    """, env, backend)
+
+    assert_equals("1548008755920", interpret("(fib 60)", env, backend))
+    assert_equals("(58 61 61)", interpret("(memo-stats fib)", env,
+                                          backend))
+
+
+@with_each_backend
+def test_least_recently_used_results_are_forgotten(backend):
+    env = new_env(memo)
+    interpret("(define square (memoize (lambda (x) (* x x)) 2))", env,
+              backend)
+    for x in [2, 3, 2, 4, 3]:
+        interpret("(square %d)" % x, env, backend)
+
+    # 3 was forgotten to make room for 4, as 2 was used more recently
+    assert_equals("(1 4 2)", interpret("(memo-stats square)", env,
+                                       backend))
+
+
+@with_each_backend
+def test_arguments_are_compared_structurally(backend):
+    env = new_env(memo)
+    interpret("(define f (memoize (lambda (x) x)))", env, backend)
+    for arg in ["#t", "1", "'1", "'(1)", '"1"', "'(1 (2 \"3\"))",
+                "'(1 (2 \"3\"))", "(cons 1 '((2 \"3\")))"]:
+        assert_equals(interpret(arg, env, backend),
+                      interpret("(f %s)" % arg, env, backend))
+
+    assert_equals("(3 5 5)", interpret("(memo-stats f)", env, backend))
+
+
+@with_each_backend
+def test_memoize_errors(backend):
+    env = new_env(memo)
+    with assert_raises_regexp(DiyLangError, "1 is not a function"):
+        interpret("(memoize 1)", env, backend)
+    with assert_raises_regexp(DiyLangError, "expected 1-2 got 0"):
+        interpret("(memoize)", env, backend)
+    with assert_raises_regexp(DiyLangError, "limit of memoize"):
+        interpret("(memoize (lambda (x) x) #t)", env, backend)
+    with assert_raises_regexp(DiyLangError, "not a memoized function"):
+        interpret("(memo-stats (lambda (x) x))", env, backend)
+
+
+@with_each_backend
+def test_memoize_is_a_function(backend):
+    env = new_env(memo)
+    interpret("(define remember memoize)", env, backend)
+    interpret("(define twice (lambda (m f) (m (m f))))", env, backend)
+    interpret("(define inc (twice remember (lambda (x) (+ x 1))))", env,
+              backend)
+
+    assert_equals("2", interpret("(inc 1)", env, backend))
+    assert_equals("2", interpret("(inc 1)", env, backend))
+    assert_equals("(1 1 1)", interpret("(memo-stats inc)", env, backend))
+
+
+@with_each_backend
+def test_defn_memo_does_not_use_memoize_from_the_environment(backend):
+    env = Environment()
+    interpret("(defn-memo f (x) x)", env, backend)
+
+    assert_equals("1", interpret("(f 1)", env, backend))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from os.path import dirname, relpath, join
+
+from nose.tools import assert_equals, assert_is_instance
+
+from diylang import native
+from diylang.interpreter import interpret, interpret_file
+from diylang.types import Environment, Builtin, DiyLangError
+
+"""
+The native versions of the list functions should behave exactly like those
+written in DIY Lang in `stdlib.diy`, including when they fail.
+"""
+
+path = join(dirname(relpath(__file__)), '..', 'stdlib.diy')
+
+programs = [
+    "(length '(1 2 3 4 5))",
+    "(length '())",
+    '(length "abc")',
+    "(length 42)",
+    "(sum (range 1 100))",
+    "(sum '(1 #t))",
+    "(range 3 1)",
+    "(range #t 3)",
+    "(reverse '(1 (2 3) 4))",
+    '(reverse "abc")',
+    "(append '(1 2) '(3 4 5))",
+    "(append '() '(1))",
+    "(append '(1) 5)",
+    "(append '() 5)",
+    '(append "ab" "cd")',
+    "(filter (lambda (x) (> x 2)) '(1 5 2 4 3))",
+    "(filter (lambda (x y) x) '(1))",
+    "(map (lambda (x) (* x x)) (range 1 5))",
+    "(map head '((1 2) (3)))",
+    "(map 42 '(1))",
+    "(reduce (lambda (x acc) (cons x acc)) '() '(1 2 3))",
+    "(reduce (lambda (x acc) (- x acc)) 0 '(1 2 3))",
+    "(sort '(6 3 7 2 4 1 5 3))",
+    "(sort '(x))",
+    "(sort '(2 x 1))",
+    "(sort '())",
+    "(map sort '((3 2 1) (5 4)))",
+    "(atom length)",
+    "(length 1 2)",
+]
+
+
+def run_all(env, backend):
+    results = []
+    for program in programs:
+        try:
+            results.append(interpret(program, env, backend))
+        except DiyLangError as e:
+            results.append("error: %s" % e)
+    return results
+
+
+def test_native_functions_replace_those_from_stdlib():
+    env = Environment()
+    interpret_file(path, env)
+    native.install(env)
+
+    assert_is_instance(env.lookup("map"), Builtin)
+    assert_equals("(2 4 6)", interpret(
+        "(filter (lambda (x) (eq (mod x 2) 0)) (range 1 6))", env))
+
+
+def test_native_functions_behave_like_stdlib():
+    for backend in ["closures", "vm"]:
+        env = Environment()
+        interpret_file(path, env, backend)
+        expected = run_all(env, backend)
+
+        native.install(env)
+        for program, want, got in zip(programs, expected,
+                                      run_all(env, backend)):
+            assert_equals((program, want), (program, got))
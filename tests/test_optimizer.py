@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from nose.tools import assert_equals, assert_raises_regexp
+
+from diylang.interpreter import interpret, interpret_file
+from diylang.optimizer import optimize
+from diylang.parser import parse, unparse
+from diylang.types import DiyLangError, Environment
+
+"""
+Tests for the optimisation pass, folding constants and removing dead branches
+before the code is run.
+"""
+
+
+def optimized(source):
+    return unparse(optimize(parse(source)))
+
+
+def test_arithmetic_and_comparisons_are_folded():
+    assert_equals("42", optimized("(* (+ 1 5) (- 10 3))"))
+    assert_equals("3", optimized("(mod (/ 7 2) 4)"))
+    assert_equals("#t", optimized("(> (+ 1 2) 2)"))
+    assert_equals("#t", optimized("(eq 'foo 'foo)"))
+    assert_equals("#f", optimized('(eq "a" "b")'))
+    assert_equals("#f", optimized("(atom '(1 2))"))
+
+
+def test_only_constant_arguments_are_folded():
+    assert_equals("(+ x 6)", optimized("(+ x (* 2 3))"))
+    assert_equals("(eq (head '(1)) 1)", optimized("(eq (head '(1)) 1)"))
+
+
+def test_failing_calls_are_left_as_they_are():
+    for source in ["(/ 1 0)", "(+ 1 #t)", "(mod 5 0)", "(+ 1 2 3)",
+                   "(atom)"]:
+        assert_equals(source, optimized(source))
+    with assert_raises_regexp(DiyLangError, "Division by zero"):
+        interpret("(+ 1 (/ 1 0))", Environment(), optimize=True)
+
+
+def test_quoted_constants_are_inlined():
+    assert_equals('(foo 5 #t "s")', optimized("(foo '5 '#t (quote \"s\"))"))
+    assert_equals("'(1 (+ 1 2))", optimized("'(1 (+ 1 2))"))
+    assert_equals("'foo", optimized("'foo"))
+
+
+def test_dead_branches_are_removed():
+    assert_equals("2", optimized("(if (> 2 1) (+ 1 1) (undefined))"))
+    assert_equals("x", optimized("(if '() (undefined) x)"))
+    assert_equals("(if x 1 2)", optimized("(if x (- 2 1) (+ 1 1))"))
+    assert_equals("(cond ((x 1) (#t 2)))",
+                  optimized("(cond ((#f 0) (x 1) ((eq 1 1) 2) (y 3)))"))
+    assert_equals("5", optimized("(cond ((#f 0) (#t (+ 2 3)) (y 3)))"))
+    assert_equals("#f", optimized("(cond ((#f 0)))"))
+
+
+def test_function_bodies_and_bindings_are_optimized():
+    assert_equals("(define f (lambda (x) (* x 6)))",
+                  optimized("(define f (lambda (x) (* x (* 2 3))))"))
+    assert_equals("(defn f (x) (if x 1 2))",
+                  optimized("(defn f (x) (if x (- 2 1) 2))"))
+    assert_equals("(let ((a 2) (b (f 2))) a)",
+                  optimized("(let ((a (+ 1 1)) (b (f 2))) (if #t a b))"))
+
+
+def test_malformed_forms_are_left_as_they_are():
+    for source in ["(if #t 1)", "(cond ((#t)))", "(let ((a (+ 1 2))))",
+                   "(lambda (x) (+ 1 2) 3)"]:
+        assert_equals(source, optimized(source))
+
+
+def test_the_ast_given_is_not_changed():
+    ast = parse("(define f (lambda (x) (if (> 1 2) x (+ 1 2))))")
+    copy = parse("(define f (lambda (x) (if (> 1 2) x (+ 1 2))))")
+    optimize(ast)
+    assert_equals(copy, ast)
+
+
+def test_optimized_stdlib_gives_the_same_results():
+    env, optimized_env = Environment(), Environment()
+    interpret_file("stdlib.diy", env)
+    interpret_file("stdlib.diy", optimized_env, optimize=True)
+    for source in ["(sum (map (lambda (x) (* x x)) (range 1 10)))",
+                   "(sort (cons (+ 1 1) '(5 3 4 1)))",
+                   "(reverse (filter (lambda (x) (> x (- 5 2)))"
+                   " (range 1 6)))"]:
+        for backend in ["closures", "vm"]:
+            assert_equals(interpret(source, env, backend),
+                          interpret(source, optimized_env, backend,
+                                    optimize=True))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+from nose.tools import assert_equals, assert_is, assert_is_none, \
+    assert_is_instance, assert_raises_regexp
+
+from diylang import memo, parallel
+from diylang.parallel import interpret_many, WorkerPool
+from diylang.interpreter import interpret
+from diylang.types import DiyLangError, Environment
+
+from helpers import new_env, with_each_backend
+
+"""
+Tests for `pmap`, mapping a function over a list in worker processes, and
+`interpret_many`, interpreting programs in worker processes.
+"""
+
+
+def teardown_module():
+    parallel.shutdown()
+
+
+@with_each_backend
+def test_pmap_gives_the_results_in_order(backend):
+    env = new_env(parallel)
+    interpret("""
+        (define fib
+            (lambda (n)
+                (if (> 2 n)
+                    n
+                    (+ (fib (- n 1)) (fib (- n 2))))))
+    """, env, backend)
+
+    assert_equals("(0 1 1 2 3 5 8 13 21 34)", interpret(
+        "(pmap fib '(0 1 2 3 4 5 6 7 8 9))", env, backend))
+    assert_equals("()", interpret("(pmap fib '())", env, backend))
+
+
+@with_each_backend
+def test_pmap_with_chunk_size(backend):
+    for chunk_size in [1, 3, 10, 100]:
+        assert_equals("(2 4 6 8 10 12 14 16 18 20)", interpret(
+            "(pmap (lambda (x) (* 2 x)) '(1 2 3 4 5 6 7 8 9 10) %d)"
+            % chunk_size, new_env(parallel), backend))
+
+
+@with_each_backend
+def test_pmap_sends_the_environment_of_the_function(backend):
+    env = new_env(parallel)
+    interpret('(define greeting "hello")', env, backend)
+
+    assert_equals('(("hello" a) ("hello" b))', interpret("""
+        (let ((f (lambda (x) (cons greeting (cons x '())))))
+            (pmap f '(a b)))
+    """, env, backend))
+
+
+@with_each_backend
+def test_pmap_of_builtins_and_memoized_functions(backend):
+    env = new_env(memo, parallel)
+    interpret("(define square (memoize (lambda (x) (* x x))))", env,
+              backend)
+
+    assert_equals("(1 4 9)", interpret("(pmap square '(1 2 3))", env,
+                                       backend))
+
+
+def test_pmap_sends_only_the_variables_needed():
+    env = new_env(parallel)
+    for source in ["(define big '(1 2 3 4 5 6 7 8 9))",
+                   "(define offset 1)",
+                   "(define shift (lambda (x) (+ x offset)))",
+                   "(define f (lambda (x) (shift x)))"]:
+        interpret(source, env)
+
+    f = pickle.loads(parallel._dumps(env.lookup("f")))
+    assert_equals(["offset", "shift"], sorted(f.env.bindings))
+    assert_equals("(2 3 4)", interpret("(pmap f '(1 2 3))", env))
+
+
+@with_each_backend
+def test_errors_in_workers_are_raised(backend):
+    with assert_raises_regexp(DiyLangError, "Division by zero"):
+        interpret("(pmap (lambda (x) (/ 1 x)) '(2 1 0))",
+                  new_env(parallel), backend)
+
+
+@with_each_backend
+def test_pmap_is_a_function(backend):
+    env = new_env(parallel)
+    interpret("(define my-map pmap)", env, backend)
+
+    assert_equals("(2 3)", interpret(
+        "(my-map (lambda (x) (+ x 1)) '(1 2))", env, backend))
+    assert_equals("(-1 -2)", interpret(
+        "((lambda (m) (m (lambda (x) (- 0 x)) '(1 2) 1)) pmap)", env,
+        backend))
+
+
+@with_each_backend
+def test_bad_arguments(backend):
+    env = new_env(parallel)
+    with assert_raises_regexp(DiyLangError, "expected 2-3 got 1"):
+        interpret("(pmap (lambda (x) x))", env, backend)
+    with assert_raises_regexp(DiyLangError, "1 is not a function"):
+        interpret("(pmap 1 '(1 2))", env, backend)
+    with assert_raises_regexp(DiyLangError, "must be a list, got 2"):
+        interpret("(pmap (lambda (x) x) 2)", env, backend)
+    with assert_raises_regexp(DiyLangError, "positive integer, got 0"):
+        interpret("(pmap (lambda (x) x) '(1 2) 0)", env, backend)
+
+
+def test_pool_is_reused():
+    env = new_env(parallel)
+    interpret("(pmap (lambda (x) x) '(1 2))", env)
+    pool = parallel._pool
+    interpret("(pmap (lambda (x) x) '(1 2))", env)
+
+    assert_is(pool, parallel._pool)
+
+
+def test_closures_are_pickled_without_compiled_code():
+    env = Environment()
+    interpret("(define add (lambda (x y) (+ x y)))", env)
+    interpret("(add 1 2)", env)
+
+    add = pickle.loads(pickle.dumps(env.lookup("add")))
+    assert_is_none(add.code)
+    assert_is(add, add.env.lookup("add"))
+    assert_equals("7", interpret("(add 3 4)", add.env))
+
+
+@with_each_backend
+def test_interpret_many_gives_the_results_in_order(backend):
+    env = Environment()
+    interpret("(define double (lambda (x) (* 2 x)))", env, backend)
+    sources = ["(double %d)" % i for i in range(20)]
+
+    assert_equals([str(2 * i) for i in range(20)],
+                  interpret_many(sources, env, workers=2,
+                                 backend=backend))
+
+
+@with_each_backend
+def test_programs_are_isolated(backend):
+    env = Environment({"shared": 1})
+    results = interpret_many([
+        "(define x 1) (define shared 2) (+ x shared)",
+        "shared",
+        "x",
+    ], env, workers=1, backend=backend, return_errors=True)
+
+    assert_equals(["3", "1"], results[:2])
+    assert_is_instance(results[2], DiyLangError)
+    assert_equals("Variable 'x' is not defined", str(results[2]))
+    assert_equals(["shared"], list(env.bindings))
+
+
+def test_python_errors_are_kept_to_their_program():
+    results = interpret_many([
+        "(+ 1 2)",
+        # Too deeply nested to unparse
+        "(define nest (lambda (n acc) (if (eq n 0) acc "
+        "(nest (- n 1) (cons acc '()))))) (nest 100000 '())",
+        "(* 2 3)",
+    ], workers=2, return_errors=True)
+
+    assert_equals(["3", "6"], [results[0], results[2]])
+    assert_is_instance(results[1], RecursionError)
+
+
+@with_each_backend
+def test_interpret_many_raises_errors(backend):
+    with assert_raises_regexp(DiyLangError, "Incomplete expression"):
+        interpret_many(["(+ 1 2)", "(+ 1"], backend=backend)
+
+
+def test_worker_pool_is_reused():
+    env = Environment()
+    interpret("(define x 42)", env)
+
+    with WorkerPool(env, workers=2) as pool:
+        assert_equals(["42"], pool.interpret_many(["x"]))
+        # Changes made after forking the workers aren't seen by them
+        interpret("(define y 1)", env)
+        assert_equals(["42", "43"],
+                      pool.interpret_many(["x", "(+ x 1)"], chunk_size=1))
+        with assert_raises_regexp(DiyLangError, "'y' is not defined"):
+            pool.interpret_many(["y"])
+
+
+def test_unknown_backend():
+    with assert_raises_regexp(DiyLangError, "Unknown backend 'nope'"):
+        interpret_many(["1"], backend="nope")
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+from itertools import count
+
+from nose.tools import assert_equals, assert_true, assert_is_none, \
+    assert_raises_regexp
+
+from diylang import memo
+from diylang.interpreter import interpret
+from diylang.parser import parse, parse_multiple
+from diylang.profiler import Profiler
+from diylang.types import DiyLangError, Environment
+
+"""
+Tests for the profiler. The clock of the profilers ticks once each time it is
+read, so the times depend only on the code run.
+"""
+
+
+def profile(source, env=None):
+    """Run the source with a new profiler, returning the result and the
+    profiler."""
+
+    profiler = Profiler(clock=count().__next__)
+    if env is None:
+        env = Environment()
+    result = None
+    for ast in parse_multiple(source):
+        result = profiler.evaluate(ast, env)
+    return result, profiler
+
+
+def stats(profiler, name, kind="function"):
+    return profiler.stats[(kind, name)]
+
+
+FACT = """
+    (define fact
+        (lambda (n)
+            (if (eq n 0)
+                1
+                (* n (fact (- n 1))))))
+"""
+
+
+def test_calls_of_functions_and_forms_are_counted():
+    result, profiler = profile(FACT + "(fact 5)")
+
+    assert_equals(120, result)
+    assert_equals(6, stats(profiler, "fact").calls)
+    assert_equals(6, stats(profiler, "if", "form").calls)
+    assert_equals(5, stats(profiler, "*", "form").calls)
+    assert_equals(1, stats(profiler, "define", "form").calls)
+    assert_equals(2, stats(profiler, "<toplevel>").calls)
+
+
+def test_recursive_calls_are_counted_once_in_inclusive_time():
+    _, profiler = profile(FACT + "(fact 20)")
+    fact = stats(profiler, "fact")
+    toplevel = stats(profiler, "<toplevel>")
+
+    assert_true(0 < fact.exclusive <= fact.inclusive < toplevel.inclusive)
+
+
+def test_exclusive_times_of_functions_add_up_to_the_total():
+    _, profiler = profile("""
+        (defn f (x) (+ (g x) (g x)))
+        (defn g (x) (* x (h x)))
+        (defn h (x) (- x 1))
+        (f 10)
+    """)
+    functions = [s for s in profiler.stats.values() if s.kind == "function"]
+    total = sum(s.inclusive for s in functions if s.name == "<toplevel>")
+
+    assert_equals(total, sum(s.exclusive for s in functions))
+    assert_equals(stats(profiler, "g").inclusive,
+                  stats(profiler, "g").exclusive
+                  + stats(profiler, "h").inclusive)
+
+
+def test_allocations_are_counted():
+    _, profiler = profile("""
+        (defn pair (x) (cons x (cons x '())))
+        (pair 1)
+        (pair 2)
+    """)
+
+    # Each call creates a frame and two cons cells
+    assert_equals(6, stats(profiler, "pair").allocations)
+    assert_equals(4, stats(profiler, "cons", "form").allocations)
+
+
+def test_tail_calls_are_made_by_the_caller_of_the_caller():
+    _, profiler = profile("""
+        (defn loop (n) (if (eq n 0) 'done (loop (- n 1))))
+        (defn start () (loop 5000))
+        (start)
+    """)
+
+    assert_equals(5001, stats(profiler, "loop").calls)
+    stacks = [line.rsplit(" ", 1)[0] for line in profiler.collapsed()]
+    assert_true("<toplevel>;loop" in stacks)
+    assert_true("<toplevel>;start;loop" not in stacks)
+
+
+def test_collapsed_stacks():
+    _, profiler = profile("""
+        (defn f () (+ (g) 1))
+        (defn g () (+ 1 2))
+        (f)
+    """)
+    lines = profiler.collapsed()
+
+    assert_equals(["<toplevel>", "<toplevel>;f", "<toplevel>;f;g"],
+                  [line.rsplit(" ", 1)[0] for line in lines])
+    # A tick of the clock is a second
+    assert_equals(sum(s.exclusive for s in profiler.stats.values()
+                      if s.kind == "function") * 1e6,
+                  sum(int(line.rsplit(" ", 1)[1]) for line in lines))
+
+
+def test_anonymous_functions_and_builtins():
+    env = Environment()
+    memo.install(env)
+    _, profiler = profile("""
+        (define sq (memoize (lambda (x) (* x x))))
+        ((lambda (x) (sq x)) 3)
+    """, env)
+
+    assert_equals(2, stats(profiler, "lambda").calls)
+    assert_equals(1, stats(profiler, "memoized").calls)
+    # Functions called by builtins are profiled as well
+    stacks = [line.rsplit(" ", 1)[0] for line in profiler.collapsed()]
+    assert_true("<toplevel>;lambda;memoized;lambda" in stacks)
+
+
+def test_profiled_code_gives_the_usual_results_and_errors():
+    env = Environment()
+    profile(FACT, env)
+
+    assert_equals("3628800", interpret("(fact 10)", env))
+    with assert_raises_regexp(DiyLangError, "wrong number of arguments"):
+        profile("(fact 1 2)", env)
+    with assert_raises_regexp(DiyLangError, "not a function"):
+        profile("(1 2)", env)
+    # The closure was not compiled with the profiler
+    assert_is_none(Profiler().evaluate(parse("(lambda (x) x)"), env).code)
+
+
+def test_recursion_as_deep_as_unprofiled():
+    env = Environment()
+    interpret(FACT, env)
+    expected = interpret("(fact 200)", env)
+
+    assert_equals(expected, str(profile("(fact 200)", env)[0]))
+
+
+def test_report_is_sorted():
+    _, profiler = profile(FACT + "(fact 5)")
+    lines = profiler.report("calls").splitlines()
+
+    assert_true(lines[0].startswith("name"))
+    calls = [int(line.split()[2]) for line in lines[1:]]
+    assert_equals(sorted(calls, reverse=True), calls)
+    assert_equals(3, len(profiler.report(limit=2).splitlines()))
+    with assert_raises_regexp(DiyLangError, "Can't sort the profile"):
+        profiler.report("name")
+
+
+def test_interpret_file():
+    fd, path = tempfile.mkstemp(suffix=".diy")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(FACT + "(fact 3)")
+        profiler = Profiler()
+
+        assert_equals("6", profiler.interpret_file(path))
+        assert_equals(4, stats(profiler, "fact").calls)
+    finally:
+        os.remove(path)
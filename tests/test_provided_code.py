@@ -2,7 +2,8 @@
 
 from nose.tools import assert_equals, assert_raises_regexp, assert_raises
 
-from diylang.parser import unparse, find_matching_paren
+from diylang.parser import unparse, find_matching_paren, parse_multiple, \
+    split_exps, parse
 from diylang.types import DiyLangError
 
 """
@@ -39,6 +40,43 @@ def test_find_matching_paren_throws_exception_on_no_closing_paren():
     with assert_raises_regexp(DiyLangError, "Incomplete expression"):
         find_matching_paren("string (without closing paren", 7)
 
+
+def test_find_matching_paren_skips_parens_in_strings():
+    source = '(foo ")" (bar))'
+    assert_equals(14, find_matching_paren(source, 0))
+
+# Tests for the reader behind parse and parse_multiple in parser.py
+
+
+def test_split_exps():
+    assert_equals(["foo", "bar", "(baz 123)", "'(a ;b\n)"],
+                  split_exps("foo bar (baz 123) '(a ;b\n)"))
+
+
+def test_parse_multiple():
+    source = """
+        ;; a comment
+        (foo bar) 'baz
+        (1 2 3) ; trailing comment"""
+    assert_equals([["foo", "bar"], ["quote", "baz"], [1, 2, 3]],
+                  parse_multiple(source))
+
+
+def test_parse_multiple_incomplete_expression():
+    with assert_raises_regexp(DiyLangError, "Incomplete expression"):
+        parse_multiple("(foo) (bar")
+
+
+def test_parse_deeply_nested_list():
+    """The reader does not recurse, so nesting is not limited by the
+    Python stack"""
+
+    depth = 10000
+    ast = parse("(" * depth + ")" * depth)
+    for _ in range(depth - 1):
+        ast = ast[0]
+    assert_equals([], ast)
+
 # Tests for unparse in parser.py
 
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from nose.tools import assert_equals, assert_raises_regexp
+
+from diylang import repl
+from diylang.types import DiyLangError, String
+
+"""
+Tests for reading expressions in the REPL, a line at a time. The lines are
+given in place of those typed at the prompt.
+"""
+
+
+def setup_module():
+    os.environ["ANSI_COLORS_DISABLED"] = "1"
+
+
+def teardown_module():
+    del os.environ["ANSI_COLORS_DISABLED"]
+    del repl.input
+
+
+def typed(*lines):
+    """Have `input` give the lines, recording the prompts shown."""
+
+    prompts = []
+    remaining = list(lines)
+
+    def fake_input(prompt):
+        prompts.append(prompt)
+        if not remaining:
+            raise EOFError()
+        return remaining.pop(0)
+    repl.input = fake_input
+    return prompts
+
+
+def test_reads_a_line_at_a_time_until_the_expression_is_complete():
+    prompts = typed("(define foo", "  (+ 1", "     2))", "(unread)")
+    assert_equals([["define", "foo", ["+", 1, 2]]], repl.read_expressions())
+    assert_equals([">  ", "…  ", "…  "], prompts)
+
+
+def test_parens_in_strings_and_comments_are_not_counted():
+    typed('(foo "(" ; )', '  ")")', "(unread)")
+    assert_equals([["foo", String("("), String(")")]],
+                  repl.read_expressions())
+
+
+def test_blank_lines_and_comments_are_skipped():
+    prompts = typed("", "; just a comment", "42 ; the answer", "(unread)")
+    assert_equals([42], repl.read_expressions())
+    assert_equals([">  ", ">  ", ">  "], prompts)
+
+
+def test_gives_all_expressions_on_the_lines_read():
+    typed("1 'foo (bar", "baz)", "(unread)")
+    assert_equals([1, ["quote", "foo"], ["bar", "baz"]],
+                  repl.read_expressions())
+
+
+def test_strings_can_span_lines():
+    typed('"two', 'lines"')
+    assert_equals([String("two\nlines")], repl.read_expressions())
+
+
+def test_errors_are_raised_when_read():
+    typed("(foo))", "(unread)")
+    with assert_raises_regexp(DiyLangError, "Unexpected '\\)'"):
+        repl.read_expressions()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import tempfile
+
+from nose.tools import assert_equals, assert_true
+
+from diylang.interpreter import interpret
+from diylang.server import Server
+from diylang.types import Environment
+
+"""
+Tests for the server evaluating code sent over a socket. Each test starts a
+server on a free port of localhost, and talks to it as a client would.
+"""
+
+
+def run_server(test, env=None, path=None):
+    """Run `test`, a coroutine function, with a server listening."""
+
+    async def main():
+        server = Server(env, workers=2)
+        await server.start(path=path)
+        try:
+            await test(server)
+        finally:
+            server.close()
+    asyncio.run(main())
+
+
+async def connect(server):
+    if isinstance(server.address, str):
+        return await asyncio.open_unix_connection(server.address)
+    return await asyncio.open_connection(*server.address[:2])
+
+
+async def send(connection, *lines):
+    """Send the lines, giving the answers to the expressions in them."""
+
+    stream, writer = connection
+    writer.write("".join(line + "\n" for line in lines).encode("utf-8"))
+    await writer.drain()
+    return json.loads((await stream.readline()).decode("utf-8"))
+
+
+async def answers(connection, count):
+    stream, _ = connection
+    return [json.loads((await stream.readline()).decode("utf-8"))
+            for _ in range(count)]
+
+
+def test_expressions_are_answered_in_order():
+    async def test(server):
+        connection = await connect(server)
+        stream, writer = connection
+        writer.write(b'(define x 2) (+ x\n 1) \'(a "b")\nundefined\n')
+        assert_equals([{"value": "x"}, {"value": "3"},
+                       {"value": '(a "b")'},
+                       {"error": "Variable 'undefined' is not defined",
+                        "type": "DiyLangError"}],
+                      await answers(connection, 4))
+        writer.close()
+    run_server(test)
+
+
+def test_sessions_share_the_environment_but_not_their_definitions():
+    env = Environment()
+    interpret("(define double (lambda (x) (* 2 x)))", env)
+
+    async def test(server):
+        first, second = await connect(server), await connect(server)
+        assert_equals({"value": "x"}, await send(first, "(define x 21)"))
+        assert_equals({"value": "42"}, await send(first, "(double x)"))
+        assert_equals({"value": "x"}, await send(second, "(define x 1)"))
+        assert_equals({"value": "2"}, await send(second, "(double x)"))
+        assert_equals({"value": "21"}, await send(first, "x"))
+        assert_true("x" not in env.bindings)
+    run_server(test, env)
+
+
+def test_syntax_errors_drop_the_expression_being_read():
+    async def test(server):
+        connection = await connect(server)
+        assert_equals("DiyLangError",
+                      (await send(connection, "(foo))"))["type"])
+        assert_equals({"value": "3"}, await send(connection, "(+ 1 2)"))
+    run_server(test)
+
+
+def test_unfinished_expressions_are_reported_at_end_of_input():
+    async def test(server):
+        stream, writer = await connect(server)
+        writer.write(b"(+ 1\n")
+        writer.write_eof()
+        assert_equals([{"error": "Incomplete expression: (+ 1",
+                        "type": "DiyLangError"}],
+                      await answers((stream, writer), 1))
+    run_server(test)
+
+
+def test_reset_starts_the_session_afresh():
+    async def test(server):
+        connection = await connect(server)
+        await send(connection, "(define x 1)")
+        assert_equals({"reset": True}, await send(connection, ":reset"))
+        assert_equals("Variable 'x' is not defined",
+                      (await send(connection, "x"))["error"])
+    run_server(test)
+
+
+def test_metrics():
+    async def test(server):
+        connection = await connect(server)
+        await send(connection, "(+ 1 2)")
+        await send(connection, "oops")
+        metrics = (await send(connection, ":metrics"))["metrics"]
+        assert_equals(1, metrics["sessions"])
+        assert_equals(1, metrics["active_sessions"])
+        assert_equals(2, metrics["requests"])
+        assert_equals(1, metrics["errors"])
+        assert_true(metrics["throughput"] > 0)
+        assert_true(0 < metrics["latency_ms"]["p50"] <=
+                    metrics["latency_ms"]["max"])
+    run_server(test)
+
+
+def test_last_expression_is_evaluated_at_end_of_input():
+    async def test(server):
+        stream, writer = await connect(server)
+        writer.write(b"(+ 1 2) 42")
+        writer.write_eof()
+        assert_equals([{"value": "3"}, {"value": "42"}],
+                      await answers((stream, writer), 2))
+        assert_equals(b"", await stream.readline())
+    run_server(test)
+
+
+def test_unix_socket():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "diylang.sock")
+
+    async def test(server):
+        connection = await connect(server)
+        assert_equals({"value": "#t"}, await send(connection, "(atom 1)"))
+    try:
+        run_server(test, path=path)
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+from io import StringIO
+
+from nose.tools import assert_equals, assert_raises_regexp
+
+from diylang.parser import Reader, parse_multiple, parse_stream
+from diylang.types import DiyLangError, String
+
+"""
+Tests for reading program source incrementally, a piece at a time, as is done
+by `interpret_file` through `parse_stream`.
+"""
+
+source = """
+    ;; some definitions
+    (define foo '(1 2 "a string (with parens)"))
+    (define bar #t) ; with a comment
+    'quoted-symbol
+    42 baz"""
+
+
+def test_parse_stream_gives_same_asts_as_parse_multiple():
+    expected = parse_multiple(source)
+    for chunk_size in [1, 2, 3, 7, 100]:
+        actual = list(parse_stream(StringIO(source), chunk_size))
+        assert_equals(expected, actual)
+
+
+def test_parse_stream_yields_expressions_before_reaching_end_of_input():
+    chunks = iter(["(foo) (bar", " baz) (un", "finished"])
+
+    class Stream(object):
+        def read(self, size):
+            return next(chunks, "")
+
+    asts = parse_stream(Stream())
+    assert_equals(["foo"], next(asts))
+    assert_equals(["bar", "baz"], next(asts))
+
+    with assert_raises_regexp(DiyLangError, "Incomplete expression"):
+        next(asts)
+
+
+def test_incomplete_expressions_are_quoted_from_their_start():
+    reader = Reader()
+    assert_equals([["foo"]], reader.feed("(foo) (bar"))
+    assert_equals([], reader.feed(" (baz)\n"))
+    with assert_raises_regexp(DiyLangError,
+                              r"Incomplete expression: \(bar \(baz\)$"):
+        reader.close()
+
+
+def test_reader_keeps_atoms_split_across_pieces_together():
+    reader = Reader()
+    assert_equals([], reader.feed("(foo ba"))
+    assert_equals([["foo", "bar"]], reader.feed("r) 12"))
+    assert_equals([123], reader.feed("3 "))
+    assert_equals([], reader.close())
+
+
+def test_reader_keeps_strings_split_across_pieces_together():
+    reader = Reader()
+    assert_equals([], reader.feed('"a ) ;'))
+    assert_equals([String("a ) ; b")], reader.feed(' b" '))
+
+
+def test_reader_keeps_strings_over_many_pieces_together():
+    reader = Reader()
+    assert_equals([], reader.feed('(foo "a \\'))
+    for piece in ['"', ' b', '', '\n', ' c \\', '\\', ' d']:
+        assert_equals([], reader.feed(piece))
+        assert_equals(True, reader.pending)
+    assert_equals([["foo", String('a \\" b\n c \\\\ d'), "bar"], "bar"],
+                  reader.feed('" bar) bar '))
+    assert_equals([], reader.close())
+
+    reader = Reader()
+    reader.feed('"never')
+    reader.feed(' closed')
+    with assert_raises_regexp(DiyLangError, 'Unclosed string: "never closed'):
+        reader.close()
+
+
+def test_reader_keeps_comments_split_across_pieces_together():
+    reader = Reader()
+    assert_equals([], reader.feed("(foo ; a comm"))
+    assert_equals([["foo"]], reader.feed("ent\n)"))
+
+
+def test_reader_knows_when_expression_is_pending():
+    reader = Reader()
+    reader.feed("(foo")
+    assert_equals(True, reader.pending)
+    reader.feed(")")
+    assert_equals(False, reader.pending)
+
+
+def test_reader_is_not_pending_after_trailing_comment():
+    reader = Reader()
+    assert_equals([["foo"]], reader.feed("(foo) ; done\n"))
+    assert_equals(False, reader.pending)
+    reader.feed("; only a comment")
+    assert_equals(False, reader.pending)
+    reader.feed("\n bar")
+    assert_equals(True, reader.pending)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+from nose.tools import assert_equals, assert_is, assert_not_equal
+
+from diylang.evaluator import evaluate
+from diylang.parser import parse, unparse
+from diylang.types import Environment, String
+
+"""
+Strings share their characters with the strings they were taken from by
+`head` and `tail`. These tests check that this is invisible to programs.
+"""
+
+
+def test_head_and_tail_share_the_text():
+    s = String("hello")
+    env = Environment({"s": s})
+
+    tail = evaluate(parse("(tail (tail s))"), env)
+    assert_is(s.text, tail.text)
+    assert_equals(String("llo"), tail)
+    assert_equals("llo", tail.val)
+    assert_is(s.text, evaluate(parse("(head (tail s))"), env).text)
+
+
+def test_views_behave_like_plain_strings():
+    view = String("xhello", 1)
+    assert_equals(String("hello"), view)
+    assert_equals(view, String("hello"))
+    assert_not_equal(String("hell"), view)
+    assert_not_equal(String("jello"), view)
+    assert_equals('"hello"', str(view))
+    assert_equals('("hello" "")', unparse([view, String("abc", 3)]))
+
+
+def test_cons_reuses_the_text_when_it_can():
+    s = String("hello")
+    env = Environment({"s": s})
+
+    rebuilt = evaluate(parse("(cons (head s) (tail s))"), env)
+    assert_is(s.text, rebuilt.text)
+    assert_equals(s, rebuilt)
+
+    other = evaluate(parse('(cons "j" (tail s))'), env)
+    assert_equals(String("jello"), other)
+    assert_equals(String("hello"), s)
+
+
+def test_equal_views_hash_the_same():
+    view = String("xhello", 1)
+    assert_equals(hash(String("hello")), hash(view))
+    assert_equals(hash(view), hash(view))
+    assert_equals(1, len(set([view, String("hello"), String("hello!", 0, 5)])))
+
+
+def test_strings_are_pickled_without_their_hash():
+    view = String("xhello", 1)
+    # As if hashed in another process, with other hashes for Python strings
+    view._hash = hash("hello") + 1
+    copy = pickle.loads(pickle.dumps(view))
+    assert_equals(view, copy)
+    assert_equals((1, 6), (copy.start, copy.end))
+    assert_equals(hash("hello"), hash(copy))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import os
+import pickle
+import shutil
+import tempfile
+from os.path import join
+
+from nose.tools import assert_equals, assert_is, assert_is_instance, \
+    assert_true, assert_false
+
+from diylang.ast import is_atom, is_symbol
+from diylang.cache import parse_file
+from diylang.evaluator import evaluate
+from diylang.interpreter import interpret
+from diylang.parser import parse, parse_multiple
+from diylang.types import Environment, String, Symbol, SYMBOLS, symbol
+
+"""
+Tests for symbols, which are interned by the parser.
+"""
+
+
+def test_parser_makes_interned_symbols():
+    first, second = parse_multiple("(define foo 1) (foo 'foo)")
+
+    assert_is_instance(first[1], Symbol)
+    assert_is(first[1], second[0])
+    assert_is(first[1], second[1][1])
+    assert_is(symbol("quote"), second[1][0])
+    assert_is(symbol("foo"), parse("foo"))
+
+
+def test_symbols_no_longer_in_use_are_forgotten():
+    ast = parse("(a-name-used-only-here 1)")
+    assert_true("a-name-used-only-here" in SYMBOLS)
+
+    del ast
+    gc.collect()
+    assert_false("a-name-used-only-here" in SYMBOLS)
+    assert_is_instance(parse("a-name-used-only-here"), Symbol)
+
+
+def test_symbols_are_strings():
+    foo = symbol("foo")
+
+    assert_equals("foo", foo)
+    assert_equals(hash("foo"), hash(foo))
+    assert_true(is_symbol(foo))
+    assert_true(is_atom(foo))
+    # Plain strings are symbols as well
+    assert_true(is_symbol("foo"))
+    assert_false(is_symbol(String("foo")))
+
+
+def test_plain_strings_and_symbols_are_the_same_variables():
+    env = Environment()
+    evaluate(["define", "x", 42], env)
+
+    assert_equals("42", interpret("x", env))
+    assert_equals("#t", interpret("(eq 'x (head '(x)))", env))
+
+
+def test_symbols_stay_interned_when_pickled():
+    foo = symbol("foo")
+
+    assert_is(foo, pickle.loads(pickle.dumps(foo)))
+
+
+def test_symbols_from_the_cache_are_interned():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "program.diy")
+        with open(path, "w") as f:
+            f.write("(define bar 'baz)")
+        cache = join(directory, "cache")
+        list(parse_file(path, cache))
+        ast, = parse_file(path, cache)
+
+        assert_equals(1, len(os.listdir(cache)))
+        assert_is(symbol("define"), ast[0])
+        assert_is(symbol("baz"), ast[2][1])
+    finally:
+        shutil.rmtree(directory)
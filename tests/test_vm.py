@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from os.path import dirname, relpath, join
+
+from nose.tools import assert_equals, assert_raises_regexp, assert_in
+
+from diylang.compiler import compile_program, disassemble
+from diylang.interpreter import interpret, interpret_file
+from diylang.parser import parse
+from diylang.types import DiyLangError, Environment
+from diylang import vm
+
+"""
+Tests for the bytecode compiler and virtual machine, the alternative to
+running code with the evaluator.
+"""
+
+env = Environment()
+path = join(dirname(relpath(__file__)), '..', 'stdlib.diy')
+interpret_file(path, env, backend="vm")
+
+
+def test_running_simple_expressions():
+    assert_equals(42, vm.evaluate(42, Environment()))
+    assert_equals(True, vm.evaluate(parse("(eq 'foo 'foo)"), Environment()))
+    assert_equals(["foo", 1], vm.evaluate(parse("'(foo 1)"), Environment()))
+    assert_equals(3, vm.evaluate(parse("(if (> 1 2) 4 (- 4 1))"),
+                                 Environment()))
+
+
+def test_running_functions_and_special_forms():
+    assert_equals("6", interpret("((lambda (x) (* x 2)) 3)", env, "vm"))
+    assert_equals("15", interpret("(let ((a 10) (b (+ a 5))) b)", env, "vm"))
+    assert_equals("bar", interpret("(cond ((#f 'foo) (#t 'bar)))", env, "vm"))
+    assert_equals("(1 2 3 4 5)", interpret("(sort '(5 3 1 2 4))", env, "vm"))
+    assert_equals('"oobar"', interpret('(tail "foobar")', env, "vm"))
+
+
+def test_let_bindings_leave_the_version_alone():
+    version = Environment.version
+    assert_equals("3", interpret("(let ((a 1) (b (+ a 1))) (+ a b))", env,
+                                 "vm"))
+    assert_equals(version, Environment.version)
+
+
+def test_errors_are_the_same_as_for_the_evaluator():
+    with assert_raises_regexp(DiyLangError, "not a function"):
+        interpret("(42)", env, "vm")
+    with assert_raises_regexp(DiyLangError, "expected 2 got 3"):
+        interpret("((lambda (a b) a) 1 2 3)", env, "vm")
+    with assert_raises_regexp(DiyLangError, "Wrong number of arguments"):
+        interpret("(define x)", env, "vm")
+    with assert_raises_regexp(DiyLangError, "not defined"):
+        interpret("undefined-variable", env, "vm")
+
+
+def test_closures_are_shared_with_the_evaluator():
+    local = env.extend({})
+    interpret("(defn add-vm (a b) (+ a b))", local, "vm")
+    interpret("(defn add-closures (a b) (+ a b))", local, "closures")
+
+    assert_equals("3", interpret("(add-vm 1 2)", local, "closures"))
+    assert_equals("3", interpret("(add-closures 1 2)", local, "vm"))
+
+
+def test_recursion_is_not_limited_by_the_python_stack():
+    assert_equals("5000", interpret("(length (range 1 5000))", env, "vm"))
+
+
+def test_calls_in_tail_position_are_compiled_to_tail_calls():
+    code = compile_program(parse("(lambda (n) (if (eq n 0) 'done (f n)))"))
+    listing = disassemble(code.constants[0])
+    assert_in("TAIL_CALL", listing)
+    assert_equals(1, listing.count("CALL"))